@@ -0,0 +1,121 @@
+"""
+Benchmark the fast-path PlayerState decoder against the protobuf runtime.
+
+    python benchmarks/bench_decoder.py --riders 100 --repeat 200
+
+Every path is timed end to end, i.e. until the values the integration
+reads are available as Python numbers:
+
+* protobuf FromString: parse the ServerToClient message with the protobuf
+  runtime and read through zwift-client's wrapper, as `api.py` used to;
+* wire decoder: walk the bytes with `decoder.iter_player_states`;
+* parse_player_states: whichever of the two `decoder` picks for the
+  installed protobuf runtime.
+
+Run it with PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python to compare
+against the pure-Python protobuf runtime.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'custom_components'))
+
+from zwift.decoder import (PlayerStateRecord, decode_player_state,  # noqa: E402
+                           iter_player_states, parse_player_states)
+from zwift.zwift_patch import zwift_messages_pb2 as new_pb2  # noqa: E402
+
+READ_FIELDS = ('power', 'heartrate', 'cadenceUHz', 'speed', 'altitude',
+               'distance', 'worldTime', 'roadTime')
+
+
+def synthetic_player_state(player_id, rng):
+    return new_pb2.PlayerState(
+        id=player_id, worldTime=rng.randrange(1 << 40), distance=rng.randrange(200000),
+        roadTime=rng.randrange(1 << 20), laps=rng.randrange(5), speed=rng.randrange(60000000),
+        roadPosition=rng.randrange(1 << 20), cadenceUHz=rng.randrange(2000000),
+        heartrate=rng.randrange(60, 200), power=rng.randrange(500), heading=rng.randrange(1 << 30),
+        lean=rng.randrange(1 << 20), climbing=rng.randrange(1000), time=rng.randrange(1 << 20),
+        f19=rng.randrange(1 << 30), f20=rng.randrange(1 << 30), progress=rng.randrange(1 << 16),
+        customisationId=rng.randrange(1 << 40), calories=rng.randrange(5000),
+        x=rng.uniform(-1e5, 1e5), altitude=rng.uniform(9000, 20000), y=rng.uniform(-1e5, 1e5),
+        groupId=rng.randrange(100), sport=rng.randrange(2))
+
+
+def synthetic_message(riders, seed=0):
+    rng = random.Random(seed)
+    return new_pb2.ServerToClient(
+        rider_id=1, world_time=rng.randrange(1 << 40), seqno=1,
+        player_states=[synthetic_player_state(i + 1, rng) for i in range(riders)]
+    ).SerializeToString()
+
+
+class PlayerStateWrapper:
+    """Stand-in for zwift-client's wrapper, which forwards via __getattr__."""
+
+    def __init__(self, player_state):
+        self.player_state = player_state
+
+    def __getattr__(self, item):
+        return getattr(self.player_state, item)
+
+
+def protobuf_path(payload):
+    message = new_pb2.ServerToClient.FromString(payload)
+    return [tuple(getattr(PlayerStateWrapper(state), field) for field in READ_FIELDS)
+            for state in message.player_states]
+
+
+def wire_path(payload, record):
+    return [tuple(getattr(state, field) for field in READ_FIELDS)
+            for state in iter_player_states(payload, record)]
+
+
+def auto_path(payload, record):
+    return [tuple(getattr(state, field) for field in READ_FIELDS)
+            for state in parse_player_states(payload, record)]
+
+
+def measure(func, repeat):
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - start_cpu
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / repeat, cpu / repeat, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--riders', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    payload = synthetic_message(args.riders)
+    record = PlayerStateRecord()
+    assert protobuf_path(payload) == wire_path(payload, record) == auto_path(payload, record)
+    single = synthetic_player_state(1, random.Random(1)).SerializeToString()
+    assert decode_player_state(single).power == new_pb2.PlayerState.FromString(single).power
+
+    from google.protobuf.internal import api_implementation
+    print('protobuf implementation: {}'.format(api_implementation.Type()))
+    print('{} riders, {} bytes per message'.format(args.riders, len(payload)))
+    for name, func in (('protobuf FromString', lambda: protobuf_path(payload)),
+                       ('wire decoder', lambda: wire_path(payload, record)),
+                       ('parse_player_states', lambda: auto_path(payload, record))):
+        wall, cpu, peak = measure(func, args.repeat)
+        print('{:<21} {:>9.1f} us/msg {:>9.1f} us cpu {:>9} B peak'.format(
+            name, wall * 1e6, cpu * 1e6, peak))
+
+
+if __name__ == '__main__':
+    main()
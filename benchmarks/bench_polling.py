@@ -0,0 +1,229 @@
+"""
+Benchmark polling cycles of the Zwift sensor platform against a fake Zwift.
+
+    python benchmarks/bench_polling.py --riders 30 --cycles 20 --latency 50
+    python benchmarks/bench_polling.py --riders 500 --batch --throttle 0.05
+    python benchmarks/bench_polling.py --riders 100 --stream
+
+Needs Home Assistant installed. A Home Assistant instance is started in a
+temporary config dir with this repo's custom component linked into it, and
+the sensor platform is set up the way a YAML `platform: zwift` entry would
+be. The Zwift endpoints point at `fake_zwift.py`, which runs in its own
+process so its CPU time is not counted against the integration.
+
+Every cycle makes all players due and awaits `ZwiftData.async_update`, i.e.
+profile and relay fetches, decoding, applying the data and the entity
+updates it dispatches. Per cycle it reports wall and CPU time, HA state
+changes written and requests served, then the peak traced allocations of
+one extra cycle and the integration's own stage timings. With `--stream`
+live data comes from `tools/replay_relay.py` replaying synthetic frames
+instead of REST polls, and cycles only fetch profiles.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import aiohttp
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+USERNAME = 'bench@example.com'
+
+
+def start_process(args, ready_text=None):
+    process = subprocess.Popen([sys.executable] + args, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True)
+    line = process.stdout.readline() if ready_text else ''
+    if ready_text and ready_text not in line:
+        process.kill()
+        raise RuntimeError('{} did not start: {}'.format(args[0], line))
+    return process, line
+
+
+async def async_start_hass(config_dir):
+    from homeassistant import loader
+    from homeassistant.core import HomeAssistant
+    from homeassistant.helpers import (area_registry, device_registry,
+                                       entity_registry, restore_state)
+
+    hass = HomeAssistant(config_dir)
+    hass.config.skip_pip = True
+    if hasattr(loader, 'async_setup'):
+        loader.async_setup(hass)
+    await asyncio.gather(area_registry.async_load(hass),
+                         device_registry.async_load(hass),
+                         entity_registry.async_load(hass))
+    await restore_state.async_load(hass)
+    await hass.async_start()
+    return hass
+
+
+def link_component(config_dir):
+    os.makedirs(os.path.join(config_dir, 'custom_components'))
+    os.symlink(os.path.join(ROOT, 'custom_components', 'zwift'),
+               os.path.join(config_dir, 'custom_components', 'zwift'))
+    # the component is imported as custom_components.zwift, like HA does
+    sys.path.insert(0, config_dir)
+
+
+async def async_fetch_stats(base_url):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(base_url + '/bench/stats') as resp:
+            return await resp.json()
+
+
+def summarize(name, values, unit, scale=1.0):
+    if not values:
+        return
+    ordered = sorted(values)
+    p95 = ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+    print('{:<22} mean {:>10.2f} {unit}  p50 {:>10.2f} {unit}  p95 {:>10.2f} {unit}'.format(
+        name, statistics.mean(values) * scale, statistics.median(values) * scale,
+        p95 * scale, unit=unit))
+
+
+async def async_run(args, config_dir):
+    server, line = start_process(
+        [os.path.join(HERE, 'fake_zwift.py'), '--riders', str(args.riders),
+         '--latency', str(args.latency), '--jitter', str(args.jitter),
+         '--throttle', str(args.throttle), '--riding', str(args.riding)]
+        + (['--retry-after', str(args.retry_after)] if args.retry_after is not None else []),
+        ready_text='listening on')
+    relay = None
+    try:
+        base_url = line.split()[-1]
+        link_component(config_dir)
+
+        from custom_components.zwift import api, auth, sensor
+        from custom_components.zwift.scheduler import PROFILE, STATE
+        api.BASE_URL = base_url
+        auth.TOKEN_URL = base_url + '/auth/realms/zwift/tokens/access/codes'
+
+        platform_config = {
+            'platform': 'zwift',
+            'username': USERNAME,
+            'password': 'bench',
+            'players': [str(player_id) for player_id in range(2, args.riders + 1)],
+            'batch_world_states': args.batch,
+            'max_concurrency': args.max_concurrency,
+            'max_request_rate': args.max_request_rate,
+        }
+        if args.stream:
+            from fake_zwift import relay_frames, write_capture
+            capture = os.path.join(config_dir, 'relay.bin')
+            write_capture(capture, relay_frames(args.riders, 60))
+            relay, _ = start_process([os.path.join(ROOT, 'tools', 'replay_relay.py'),
+                                      capture, '--port', str(args.relay_port),
+                                      '--rate', '1', '--loop'])
+            await asyncio.sleep(0.5)
+            platform_config['stream'] = {'host': '127.0.0.1', 'port': args.relay_port}
+
+        from homeassistant.core import callback
+        hass = await async_start_hass(config_dir)
+        state_changes = []
+
+        @callback
+        def async_count_state_change(event):
+            state_changes.append(event.data.get('entity_id'))
+
+        hass.bus.async_listen('state_changed', async_count_state_change)
+
+        from homeassistant.setup import async_setup_component
+        started = time.perf_counter()
+        assert await async_setup_component(hass, 'sensor', {'sensor': [platform_config]})
+        zwift_data = hass.data[sensor.DATA_ZWIFT][USERNAME]
+        while zwift_data.startup_time is None:
+            await asyncio.sleep(0.01)
+        await hass.async_block_till_done()
+        print('{} riders, setup and first update in {:.3f}s, {} entities'.format(
+            args.riders, time.perf_counter() - started, len(hass.states.async_all())))
+
+        # the benchmark drives the cycles, keep the polling loop out of the way
+        scheduler = zwift_data._scheduler
+        scheduler.online_interval = scheduler.offline_interval = \
+            scheduler.profile_interval = 1e9
+        player_ids = list(zwift_data.players)
+
+        async def cycle(index):
+            now = time.monotonic()
+            for player_id in player_ids:
+                scheduler.expedite(player_id, STATE, now)
+                if index % args.profile_every == 0:
+                    scheduler.expedite(player_id, PROFILE, now)
+            await zwift_data.async_update()
+            await hass.async_block_till_done()
+
+        walls, cpus, writes = [], [], []
+        requests_before = zwift_data.metrics.requests
+        for index in range(args.cycles):
+            if args.stream:
+                await asyncio.sleep(args.stream_wait)
+            del state_changes[:]
+            cpu = time.process_time()
+            wall = time.perf_counter()
+            await cycle(index)
+            walls.append(time.perf_counter() - wall)
+            cpus.append(time.process_time() - cpu)
+            writes.append(len(state_changes))
+
+        tracemalloc.start()
+        await cycle(0)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print('{} cycles, profiles every {} cycles{}{}'.format(
+            args.cycles, args.profile_every, ', batched' if args.batch else '',
+            ', streaming' if args.stream else ''))
+        summarize('cycle wall time', walls, 'ms', 1000)
+        summarize('cycle cpu time', cpus, 'ms', 1000)
+        summarize('state changes', writes, '   ')
+        print('{:<22} {} B (one traced cycle)'.format('peak allocations', peak))
+        print('{:<22} {:.1f} per cycle'.format(
+            'requests sent', (zwift_data.metrics.requests - requests_before) / max(args.cycles, 1)))
+        if args.stream:
+            print('{:<22} {}'.format('relay messages', zwift_data._stream.messages))
+        print('fake zwift served: {}'.format(json.dumps(await async_fetch_stats(base_url))))
+        print('stage timings: {}'.format(json.dumps(zwift_data.metrics.as_dict()['stages'])))
+
+        await hass.async_stop(force=True)
+    finally:
+        server.kill()
+        if relay is not None:
+            relay.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--riders', type=int, default=30, choices=range(1, 501), metavar='1-500')
+    parser.add_argument('--cycles', type=int, default=20)
+    parser.add_argument('--profile-every', type=int, default=5,
+                        help='fetch profiles every N cycles')
+    parser.add_argument('--latency', type=float, default=0.0, help='milliseconds per response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random milliseconds')
+    parser.add_argument('--throttle', type=float, default=0.0, help='fraction of 429 responses')
+    parser.add_argument('--retry-after', type=float, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--riding', type=float, default=1.0, help='fraction of riders in game')
+    parser.add_argument('--batch', action='store_true', help='enable batch_world_states')
+    parser.add_argument('--max-concurrency', type=int, default=4)
+    parser.add_argument('--max-request-rate', type=float, default=1000.0)
+    parser.add_argument('--stream', action='store_true', help='live data from a replayed relay')
+    parser.add_argument('--relay-port', type=int, default=13023)
+    parser.add_argument('--stream-wait', type=float, default=1.0,
+                        help='seconds of streaming between cycles')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        asyncio.run(async_run(args, config_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+Local fake of the Zwift REST and relay endpoints used by the benchmarks.
+
+    python benchmarks/fake_zwift.py --riders 100 --latency 50 --throttle 0.02
+
+Serves the token endpoint, profiles, latest activities and relay player
+states for riders 1..N (rider 1 is the account itself, `/api/profiles/me`).
+Player states are synthetic `PlayerState` protobufs built with the helpers
+of `bench_decoder.py`, with a world time that keeps moving forward. Every
+response can be delayed (`--latency`, `--jitter`) and a fraction of them
+replaced by 429s (`--throttle`, optionally with `--retry-after`).
+
+Request counters are served as JSON from `/bench/stats`. `write_capture`
+produces a relay capture of the same riders for `tools/replay_relay.py`.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+from bench_decoder import new_pb2, synthetic_player_state
+
+TOKEN_PATH = '/auth/realms/zwift/tokens/access/codes'
+STATS_PATH = '/bench/stats'
+WORLD_ID = 1
+TOKEN_EXPIRES_IN = 3600
+
+
+class FakeZwift:
+    """aiohttp application answering like the Zwift API for N riders."""
+
+    def __init__(self, riders, latency=0.0, jitter=0.0, throttle=0.0,
+                 retry_after=None, riding=1.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.player_ids = list(range(1, riders + 1))
+        self.riding = {player_id: player_id == 1 or self.rng.random() < riding
+                       for player_id in self.player_ids}
+        self.rideons = Counter()
+        self.requests = Counter()
+        self._world_time = int(time.time() * 1000)
+
+        self.app = web.Application()
+        self.app.router.add_post(TOKEN_PATH, self.handle_token)
+        self.app.router.add_get('/api/profiles/{player_id}', self.handle_profile)
+        self.app.router.add_get('/api/profiles/{player_id}/activities', self.handle_activities)
+        self.app.router.add_get('/relay/worlds/{world_id}/players/{player_id}', self.handle_player_state)
+        self.app.router.add_get('/relay/worlds/{world_id}', self.handle_world)
+        self.app.router.add_get(STATS_PATH, self.handle_stats)
+
+    def world_time(self):
+        """A strictly increasing relay world time in milliseconds."""
+        self._world_time = max(self._world_time + 1, int(time.time() * 1000))
+        return self._world_time
+
+    def profile(self, player_id):
+        riding = self.riding[player_id]
+        return {
+            'id': player_id,
+            'firstName': 'Rider',
+            'lastName': str(player_id),
+            'useMetric': True,
+            'riding': riding,
+            'worldId': WORLD_ID if riding else None,
+            'achievementLevel': 1000 + player_id,
+            'runAchievementLevel': 500 + player_id,
+            'totalExperiencePoints': 10000 * player_id,
+            'privateAttributes': {},
+            'publicAttributes': {},
+        }
+
+    def activity(self, player_id):
+        if self.riding[player_id] and self.rng.random() < 0.05:
+            self.rideons[player_id] += 1
+        return {
+            'id': player_id * 1000,
+            'name': 'Benchmark ride',
+            'worldId': WORLD_ID,
+            'activityRideOnCount': self.rideons[player_id],
+        }
+
+    def player_state(self, player_id):
+        state = synthetic_player_state(player_id, self.rng)
+        state.worldTime = self.world_time()
+        return state
+
+    async def _respond(self, kind):
+        """Apply latency and throttling, returning a 429 response or None."""
+        self.requests[kind] += 1
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.throttle and self.rng.random() < self.throttle:
+            self.requests['throttled'] += 1
+            headers = {}
+            if self.retry_after is not None:
+                headers['Retry-After'] = str(self.retry_after)
+            return web.Response(status=429, reason='Too Many Requests', headers=headers)
+        return None
+
+    def _player_id(self, request):
+        player_id = request.match_info['player_id']
+        if player_id == 'me':
+            return 1
+        try:
+            player_id = int(player_id)
+        except ValueError:
+            raise web.HTTPNotFound()
+        if player_id not in self.riding:
+            raise web.HTTPNotFound()
+        return player_id
+
+    async def handle_token(self, request):
+        self.requests['token'] += 1
+        return web.json_response({
+            'access_token': 'bench-access-token',
+            'expires_in': TOKEN_EXPIRES_IN,
+            'refresh_token': 'bench-refresh-token',
+            'refresh_expires_in': TOKEN_EXPIRES_IN * 24,
+        })
+
+    async def handle_profile(self, request):
+        return await self._respond('profile') or \
+            web.json_response(self.profile(self._player_id(request)))
+
+    async def handle_activities(self, request):
+        return await self._respond('activities') or \
+            web.json_response([self.activity(self._player_id(request))])
+
+    async def handle_player_state(self, request):
+        throttled = await self._respond('player_state')
+        if throttled is not None:
+            return throttled
+        player_id = self._player_id(request)
+        if not self.riding[player_id]:
+            raise web.HTTPNotFound()
+        return web.Response(body=self.player_state(player_id).SerializeToString(),
+                            content_type='application/x-protobuf-lite')
+
+    async def handle_world(self, request):
+        throttled = await self._respond('world')
+        if throttled is not None:
+            return throttled
+        message = new_pb2.ServerToClient(
+            rider_id=1, world_time=self.world_time(), seqno=1,
+            player_states=[self.player_state(player_id) for player_id in self.player_ids
+                           if self.riding[player_id]])
+        return web.Response(body=message.SerializeToString(),
+                            content_type='application/x-protobuf-lite')
+
+    async def handle_stats(self, request):
+        return web.json_response(dict(self.requests))
+
+
+def relay_frames(riders, count, seed=0, interval=1.0):
+    """ServerToClient messages for riders 1..N, one second of world time apart."""
+    rng = random.Random(seed)
+    world_time = int(time.time() * 1000)
+    frames = []
+    for index in range(count):
+        states = []
+        for player_id in range(1, riders + 1):
+            state = synthetic_player_state(player_id, rng)
+            state.worldTime = world_time + int(index * interval * 1000)
+            states.append(state)
+        frames.append(new_pb2.ServerToClient(
+            rider_id=1, world_time=world_time, seqno=index + 1,
+            player_states=states).SerializeToString())
+    return frames
+
+
+def write_capture(path, frames):
+    """Write frames in the length-prefixed format read by replay_relay.py."""
+    with open(path, 'wb') as capture:
+        for frame in frames:
+            capture.write(len(frame).to_bytes(2, 'big') + frame)
+
+
+async def serve(fake, host, port):
+    runner = web.AppRunner(fake.app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    for address in runner.addresses:
+        print('listening on http://{}:{}'.format(host, address[1]), flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--riders', type=int, default=30)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='0 picks a free port')
+    parser.add_argument('--latency', type=float, default=0.0, help='milliseconds per response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random milliseconds')
+    parser.add_argument('--throttle', type=float, default=0.0, help='fraction of 429 responses')
+    parser.add_argument('--retry-after', type=float, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--riding', type=float, default=1.0, help='fraction of riders in game')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeZwift(args.riders, latency=args.latency / 1000.0, jitter=args.jitter / 1000.0,
+                     throttle=args.throttle, retry_after=args.retry_after,
+                     riding=args.riding, seed=args.seed)
+    try:
+        asyncio.run(serve(fake, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
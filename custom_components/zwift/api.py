@@ -0,0 +1,95 @@
+"""
+Async access to the Zwift REST and relay endpoints.
+
+The upstream zwift-client library only ships blocking `requests` helpers,
+which forces every poll onto an executor thread. This module mirrors the
+handful of endpoints the sensor platform uses on top of Home Assistant's
+shared aiohttp session so that many players can be fetched concurrently.
+"""
+
+import asyncio
+import logging
+
+from .decoder import parse_player_state, parse_player_states
+from .metrics import STAGE_DECODE, PipelineMetrics
+from .ratelimit import RateLimiter, parse_retry_after
+
+_LOGGER = logging.getLogger(__name__)
+
+BASE_URL = 'https://us-or-rly101.zwift.com'
+DEFAULT_HEADERS = {
+    "User-Agent": "Zwift/115 CFNetwork/758.0.2 Darwin/15.0.0"}
+
+ACCEPT_JSON = 'application/json'
+ACCEPT_PROTOBUF = 'application/x-protobuf-lite'
+
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class RequestException(Exception):
+    """An HTTP error from Zwift, formatted as "<status> - <reason>"."""
+
+
+class ZwiftApiClient:
+    """Non-blocking counterpart of the zwift-client `Request` helpers."""
+
+    def __init__(self, session, get_access_token,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, rate_limiter=None,
+                 metrics=None):
+        self._session = session
+        self._get_access_token = get_access_token
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.metrics = metrics or PipelineMetrics()
+
+    async def _get(self, url, accept_type, player_id=None):
+        access_token = await self._get_access_token()
+        headers = {
+            "Accept": accept_type,
+            "Authorization": "Bearer " + access_token
+        }
+        headers.update(DEFAULT_HEADERS)
+        async with self._semaphore:
+            await self.rate_limiter.acquire()
+            async with self._session.get(BASE_URL + url, headers=headers) as resp:
+                self.metrics.count_request(resp.status, player_id)
+                if resp.status == 429:
+                    self.rate_limiter.on_throttled(
+                        parse_retry_after(resp.headers.get('Retry-After')))
+                elif resp.status < 400:
+                    self.rate_limiter.on_success()
+                if resp.status >= 400:
+                    raise RequestException("{} - {}".format(
+                        resp.status, resp.reason))
+                if accept_type == ACCEPT_JSON:
+                    return await resp.json(content_type=None)
+                return await resp.read()
+
+    async def get_profile(self, player_id):
+        return await self._get(
+            '/api/profiles/{}'.format(player_id), ACCEPT_JSON, player_id)
+
+    async def get_latest_activity(self, player_id):
+        activities = await self._get(
+            '/api/profiles/{}/activities?start=0&limit=1'.format(player_id),
+            ACCEPT_JSON, player_id)
+        return activities[0] if activities and len(activities) == 1 else None
+
+    async def get_player_state(self, world_id, player_id):
+        buffer = await self._get(
+            '/relay/worlds/{}/players/{}'.format(world_id, player_id),
+            ACCEPT_PROTOBUF, player_id)
+        with self.metrics.time(STAGE_DECODE):
+            return parse_player_state(buffer)
+
+    async def get_world_player_states(self, world_id):
+        """Fetch every player state in a world with one relay request.
+
+        The payload is decoded once as a `ServerToClient` message and indexed
+        by player id (as a string, matching the configured player ids).
+        """
+        buffer = await self._get(
+            '/relay/worlds/{}'.format(world_id), ACCEPT_PROTOBUF)
+        with self.metrics.time(STAGE_DECODE):
+            return {str(player_state.id): player_state
+                    for player_state in parse_player_states(buffer)}
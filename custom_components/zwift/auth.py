@@ -0,0 +1,180 @@
+"""
+Zwift access token lifecycle.
+
+Tokens are refreshed in the background shortly before they expire, all
+callers share a single in-flight refresh, and the latest tokens are kept in
+Home Assistant's `.storage` so a restart can continue with the stored
+refresh token instead of a full password login.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store
+
+from .metrics import STAGE_AUTH, PipelineMetrics
+
+_LOGGER = logging.getLogger(__name__)
+
+TOKEN_URL = 'https://secure.zwift.com/auth/realms/zwift/tokens/access/codes'
+CLIENT_ID = 'Zwift_Mobile_Link'
+
+STORAGE_VERSION = 1
+STORAGE_KEY = 'zwift_auth_{}'
+
+# refresh this many seconds before the access token expires
+REFRESH_MARGIN = 60
+MIN_REFRESH_DELAY = 5
+
+
+class ZwiftAuthError(Exception):
+    """Raised when Zwift refuses to hand out a token."""
+
+
+class TokenManager:
+    """Owns the access and refresh tokens of one Zwift account."""
+
+    def __init__(self, hass, session, username, password, metrics=None):
+        self.hass = hass
+        self.metrics = metrics or PipelineMetrics()
+        self._session = session
+        self.username = username
+        self.password = password
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY.format(
+            hashlib.sha1(username.encode()).hexdigest()[:12]))
+        self.access_token = None
+        self.access_token_expiration = 0
+        self.refresh_token = None
+        self.refresh_token_expiration = 0
+        # the few bits of the account's own profile needed before connecting
+        self.profile = {}
+        self._loaded = False
+        self._refresh_task = None
+        self._unsub_refresh = None
+
+    def have_valid_access_token(self, margin=0):
+        return bool(self.access_token) and time.time() + margin < self.access_token_expiration
+
+    def have_valid_refresh_token(self):
+        return bool(self.refresh_token) and time.time() < self.refresh_token_expiration
+
+    async def async_load(self):
+        """Restore tokens persisted by a previous run."""
+        if self._loaded:
+            return
+        self._loaded = True
+        stored = await self._store.async_load()
+        if stored:
+            self.access_token = stored.get('access_token')
+            self.access_token_expiration = stored.get('access_token_expiration', 0)
+            self.refresh_token = stored.get('refresh_token')
+            self.refresh_token_expiration = stored.get('refresh_token_expiration', 0)
+            self.profile = stored.get('profile', {})
+            if self.have_valid_access_token(REFRESH_MARGIN):
+                self._schedule_refresh()
+
+    async def async_get_access_token(self):
+        if self.have_valid_access_token():
+            return self.access_token
+        await self.async_refresh()
+        return self.access_token
+
+    def invalidate(self):
+        """Forget the access token after Zwift rejected it (401)."""
+        self.access_token = None
+        self.access_token_expiration = 0
+
+    async def async_refresh(self):
+        """Refresh the tokens, joining a refresh that is already running."""
+        if self._refresh_task is None:
+            self._refresh_task = self.hass.async_create_task(self._async_timed_refresh())
+        task = self._refresh_task
+        try:
+            await asyncio.shield(task)
+        finally:
+            if task.done() and self._refresh_task is task:
+                self._refresh_task = None
+
+    async def _async_timed_refresh(self):
+        with self.metrics.time(STAGE_AUTH):
+            await self._async_refresh()
+
+    async def _async_refresh(self):
+        token_data = None
+        if self.have_valid_refresh_token():
+            try:
+                token_data = await self._async_request_token({
+                    "refresh_token": self.refresh_token,
+                    "grant_type": "refresh_token",
+                })
+            except ZwiftAuthError as e:
+                _LOGGER.debug("Zwift token refresh failed, logging in again: {}".format(e))
+        if token_data is None:
+            token_data = await self._async_request_token({
+                "username": self.username,
+                "password": self.password,
+                "grant_type": "password",
+            })
+        now = time.time()
+        self.access_token = token_data['access_token']
+        self.access_token_expiration = now + token_data.get('expires_in', 0)
+        self.refresh_token = token_data.get('refresh_token')
+        self.refresh_token_expiration = now + token_data.get('refresh_expires_in', 0)
+        await self._async_save()
+        self._schedule_refresh()
+
+    async def async_save_profile(self, profile):
+        """Remember the account's player id and unit preference."""
+        profile = {'id': profile.get('id'), 'useMetric': profile.get('useMetric', False)}
+        if profile != self.profile:
+            self.profile = profile
+            await self._async_save()
+
+    async def _async_save(self):
+        await self._store.async_save({
+            'access_token': self.access_token,
+            'access_token_expiration': self.access_token_expiration,
+            'refresh_token': self.refresh_token,
+            'refresh_token_expiration': self.refresh_token_expiration,
+            'profile': self.profile,
+        })
+
+    async def _async_request_token(self, data):
+        data['client_id'] = CLIENT_ID
+        async with self._session.post(TOKEN_URL, data=data) as resp:
+            body = await resp.read()
+        # error pages are not always JSON
+        try:
+            token_data = json.loads(body)
+        except ValueError:
+            raise ZwiftAuthError("Zwift authorization failed ({}): {}".format(
+                resp.status, body[:200].decode(errors='replace')))
+        if resp.status >= 400 or not isinstance(token_data, dict) \
+                or 'error' in token_data or 'access_token' not in token_data:
+            raise ZwiftAuthError("Zwift authorization failed ({}): {}".format(
+                resp.status, token_data))
+        return token_data
+
+    def _schedule_refresh(self):
+        if self._unsub_refresh is not None:
+            self._unsub_refresh()
+        delay = max(self.access_token_expiration - time.time() - REFRESH_MARGIN,
+                    MIN_REFRESH_DELAY)
+        self._unsub_refresh = async_call_later(
+            self.hass, delay, self._async_scheduled_refresh)
+
+    async def _async_scheduled_refresh(self, now):
+        self._unsub_refresh = None
+        try:
+            await self.async_refresh()
+        except Exception as e:
+            _LOGGER.warning("Proactive Zwift token refresh failed: {}".format(e))
+
+    def async_stop(self):
+        if self._unsub_refresh is not None:
+            self._unsub_refresh()
+            self._unsub_refresh = None
@@ -0,0 +1,47 @@
+"""Expiring caches for slow-changing Zwift data."""
+
+from collections import OrderedDict
+
+DEFAULT_MAXSIZE = 256
+
+
+class TTLCache:
+    """Small LRU cache whose entries expire `ttl` seconds after being stored.
+
+    Times are passed in explicitly (monotonic seconds) so callers can share
+    one clock reading across a whole update cycle.
+    """
+
+    def __init__(self, ttl, maxsize=DEFAULT_MAXSIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if now >= expires:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, now):
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
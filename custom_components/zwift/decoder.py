@@ -0,0 +1,279 @@
+"""
+Fast-path decoding of PlayerState protobuf messages.
+
+Only the handful of fields the integration reads end up in a slotted
+`PlayerStateRecord`, instead of a full protobuf object plus zwift-client
+wrapper per rider. How the bytes are parsed depends on the protobuf runtime:
+
+* with the pure-Python runtime, `decode_player_state`/`iter_player_states`
+  walk the wire bytes through a memoryview and skip unused fields without
+  materialising them, which is several times faster;
+* with a C runtime (upb/cpp) its parser beats anything written in Python,
+  so messages are parsed by protobuf and only the fields we read are copied
+  out.
+
+`parse_player_state` and `parse_player_states` pick the right one on first
+use; see `benchmarks/bench_decoder.py`. protobuf itself is not imported
+until then, and with the pure-Python runtime only the runtime check is.
+"""
+
+import struct
+
+_FLOAT = struct.Struct('<f').unpack_from
+
+_VARINT = 0
+_I64 = 1
+_LEN = 2
+_I32 = 5
+
+_INT = 0
+_FLOAT_FIELD = 1
+
+# PlayerState field number -> (attribute, kind); see zwift_messages.proto
+PLAYER_STATE_FIELDS = {
+    1: ('id', _INT),
+    2: ('worldTime', _INT),
+    3: ('distance', _INT),
+    4: ('roadTime', _INT),
+    5: ('laps', _INT),
+    6: ('speed', _INT),
+    8: ('roadPosition', _INT),
+    9: ('cadenceUHz', _INT),
+    11: ('heartrate', _INT),
+    12: ('power', _INT),
+    19: ('f19', _INT),
+    20: ('f20', _INT),
+    21: ('progress', _INT),
+    25: ('x', _FLOAT_FIELD),
+    26: ('altitude', _FLOAT_FIELD),
+    27: ('y', _FLOAT_FIELD),
+    29: ('groupId', _INT),
+}
+_FLOAT_SLOTS = tuple(name for name, kind in PLAYER_STATE_FIELDS.values()
+                     if kind == _FLOAT_FIELD)
+
+# ServerToClient.player_states
+_SERVER_TO_CLIENT_PLAYER_STATES = 8
+
+
+class DecodeError(ValueError):
+    """Raised when a buffer is not a well formed protobuf message."""
+
+
+class PlayerStateRecord:
+    """The subset of a PlayerState the integration uses.
+
+    Exposes the same attribute names as the protobuf message, plus the
+    derived `cadence` and `ride_ons` values of zwift-client's
+    `PlayerStateWrapper`, so it can be used in its place, the altitude in
+    metres and the road a rider is on with their direction of travel.
+    """
+
+    __slots__ = tuple(name for name, _ in PLAYER_STATE_FIELDS.values())
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+        for name in _FLOAT_SLOTS:
+            setattr(self, name, 0.0)
+
+    @property
+    def cadence(self):
+        return int((self.cadenceUHz * 60) / 1000000)
+
+    @property
+    def ride_ons(self):
+        return (self.f19 >> 24) & 0xfff
+
+    @property
+    def altitude_meters(self):
+        """Altitude in metres; the relay sends half centimetres above 9000.
+
+        >>> record = PlayerStateRecord()
+        >>> record.altitude = 19000.0
+        >>> record.altitude_meters
+        50.0
+        """
+        return (self.altitude - 9000) / 200.0
+
+    @property
+    def road_id(self):
+        return (self.f20 & 0xff00) >> 8
+
+    @property
+    def is_forward(self):
+        return (self.f19 & 4) != 0
+
+    @property
+    def player_state(self):
+        return self
+
+    def __repr__(self):
+        return 'PlayerStateRecord({})'.format(', '.join(
+            '{}={}'.format(name, getattr(self, name)) for name in self.__slots__))
+
+
+def _read_varint(buffer, pos, end):
+    result = 0
+    shift = 0
+    while pos < end:
+        byte = buffer[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+    raise DecodeError('truncated varint')
+
+
+def _decode_into(buffer, pos, end, record):
+    fields = PLAYER_STATE_FIELDS
+    while pos < end:
+        byte = buffer[pos]
+        if byte < 0x80:
+            key = byte
+            pos += 1
+        else:
+            key, pos = _read_varint(buffer, pos, end)
+        field = fields.get(key >> 3)
+        wire_type = key & 7
+        if wire_type == _VARINT:
+            byte = buffer[pos]
+            if byte < 0x80:
+                value = byte
+                pos += 1
+            else:
+                value, pos = _read_varint(buffer, pos, end)
+            if field is not None:
+                if value >= 0x8000000000000000:
+                    value -= 0x10000000000000000
+                setattr(record, field[0], value)
+        elif wire_type == _I32:
+            if field is not None:
+                setattr(record, field[0], _FLOAT(buffer, pos)[0])
+            pos += 4
+        elif wire_type == _I64:
+            pos += 8
+        elif wire_type == _LEN:
+            size, pos = _read_varint(buffer, pos, end)
+            pos += size
+        else:
+            raise DecodeError('unsupported wire type {}'.format(wire_type))
+    if pos != end:
+        raise DecodeError('truncated message')
+    return record
+
+
+def decode_player_state(buffer, record=None):
+    """Decode a serialized PlayerState, optionally into an existing record."""
+    if record is None:
+        record = PlayerStateRecord()
+    else:
+        record.clear()
+    view = memoryview(buffer)
+    try:
+        return _decode_into(view, 0, len(view), record)
+    except (IndexError, struct.error) as e:
+        raise DecodeError('truncated message') from e
+
+
+def iter_player_states(buffer, record=None):
+    """Yield every PlayerState of a serialized ServerToClient message.
+
+    When `record` is given it is refilled and yielded for every player
+    state, so nothing is allocated per rider; callers must then copy what
+    they need before advancing the iterator.
+    """
+    view = memoryview(buffer)
+    pos = 0
+    end = len(view)
+    while pos < end:
+        key, pos = _read_varint(view, pos, end)
+        wire_type = key & 7
+        if wire_type == _LEN:
+            size, pos = _read_varint(view, pos, end)
+            if key >> 3 == _SERVER_TO_CLIENT_PLAYER_STATES:
+                if record is None:
+                    state = PlayerStateRecord()
+                else:
+                    state = record
+                    state.clear()
+                try:
+                    _decode_into(view, pos, pos + size, state)
+                except (IndexError, struct.error) as e:
+                    raise DecodeError('truncated message') from e
+                yield state
+            pos += size
+        elif wire_type == _VARINT:
+            _, pos = _read_varint(view, pos, end)
+        elif wire_type == _I64:
+            pos += 8
+        elif wire_type == _I32:
+            pos += 4
+        else:
+            raise DecodeError('unsupported wire type {}'.format(wire_type))
+
+
+_messages = None
+_wire_decoder = None
+
+
+def _messages_pb2():
+    """Import the generated protobuf module on first use only."""
+    global _messages
+    if _messages is None:
+        from .zwift_patch import zwift_messages_pb2
+        _messages = zwift_messages_pb2
+    return _messages
+
+
+def use_wire_decoder():
+    """Whether the wire decoder beats the installed protobuf runtime."""
+    global _wire_decoder
+    if _wire_decoder is None:
+        try:
+            from google.protobuf.internal import api_implementation
+            _wire_decoder = api_implementation.Type() == 'python'
+        except ImportError:
+            _wire_decoder = True
+    return _wire_decoder
+
+
+def encode_client_hello(rider_id, seqno):
+    """A serialized ClientToServer message announcing a rider to the relay."""
+    return _messages_pb2().ClientToServer(
+        connected=1, rider_id=int(rider_id or 0), seqno=seqno).SerializeToString()
+
+
+def _from_string(message_type, buffer):
+    """Parse with protobuf, raising our DecodeError like the wire decoder."""
+    from google.protobuf.message import DecodeError as ProtobufDecodeError
+    try:
+        return message_type.FromString(buffer)
+    except ProtobufDecodeError as e:
+        raise DecodeError(str(e)) from e
+
+
+def _copy_fields(message, record):
+    for name in PlayerStateRecord.__slots__:
+        setattr(record, name, getattr(message, name))
+    return record
+
+
+def parse_player_state(buffer, record=None):
+    """Parse a serialized PlayerState with the fastest available decoder."""
+    if use_wire_decoder():
+        return decode_player_state(buffer, record)
+    return _copy_fields(_from_string(_messages_pb2().PlayerState, buffer),
+                        record or PlayerStateRecord())
+
+
+def parse_player_states(buffer, record=None):
+    """Iterate the PlayerStates of a serialized ServerToClient message."""
+    if use_wire_decoder():
+        return iter_player_states(buffer, record)
+    return (_copy_fields(message, record or PlayerStateRecord())
+            for message in _from_string(_messages_pb2().ServerToClient, buffer).player_states)
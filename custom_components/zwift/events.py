@@ -0,0 +1,164 @@
+"""
+Ride events derived from successive player updates.
+
+`RideEventDetector` keeps a little state per player and turns each update
+into events: ride started/ended, ride-ons, level ups and distance
+milestones. The first update of a player only seeds that state, so a
+restart never replays events that already happened. `EventDebouncer`
+coalesces bursts (several ride-ons in a row, a ride that flaps between
+started and ended) and fires the result on the event bus from the loop.
+"""
+
+import time
+
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+
+EVENT_ZWIFT_RIDE_ON = 'zwift_ride_on'
+EVENT_ZWIFT_RIDE_STARTED = 'zwift_ride_started'
+EVENT_ZWIFT_RIDE_ENDED = 'zwift_ride_ended'
+EVENT_ZWIFT_LEVEL_UP = 'zwift_level_up'
+EVENT_ZWIFT_DISTANCE_MILESTONE = 'zwift_distance_milestone'
+
+# meters between two distance milestones
+MILESTONE_DISTANCE = 10000
+# seconds a burst of events is collected before it is fired
+DEBOUNCE_DELAY = 5
+
+_RIDE = 'ride'
+
+
+class RideEventDetector:
+    """Incremental event detection for one player."""
+
+    def __init__(self, player_id, milestone_distance=MILESTONE_DISTANCE):
+        self.player_id = player_id
+        self.milestone_distance = milestone_distance
+        self._seeded = False
+        self._riding = False
+        self._activity_id = None
+        self._rideons = 0
+        self._level = None
+        self._milestone = None
+        self._ride_started = None
+        self._distance = 0.0
+
+    def observe(self, player_profile, data):
+        """Return the `(event_type, event_data)` pairs caused by an update."""
+        latest_activity = player_profile.get('latest_activity') or {}
+        riding = bool(data.get('online') or player_profile.get('riding'))
+        activity_id = latest_activity.get('id')
+        rideons = latest_activity.get('activityRideOnCount', 0) or 0
+        level = player_profile.get('playerLevel')
+        distance = data.get('distance')
+
+        if not self._seeded:
+            self._seeded = True
+            self._riding = riding
+            self._activity_id = activity_id
+            self._rideons = rideons
+            self._level = level
+            if riding and distance is not None:
+                self._milestone = int(distance // self.milestone_distance)
+                self._distance = distance
+            return []
+
+        events = []
+        player_id = self.player_id
+        if riding and not self._riding:
+            self._ride_started = time.time()
+            self._milestone = 0
+            self._distance = 0.0
+            events.append((EVENT_ZWIFT_RIDE_STARTED, {'player_id': player_id}))
+        elif not riding and self._riding:
+            ended = {'player_id': player_id, 'distance': self._distance}
+            if self._ride_started is not None:
+                ended['duration'] = round(time.time() - self._ride_started)
+            self._ride_started = None
+            self._milestone = None
+            events.append((EVENT_ZWIFT_RIDE_ENDED, ended))
+        self._riding = riding
+
+        # a new activity starts counting from zero again
+        if activity_id != self._activity_id:
+            self._activity_id = activity_id
+            self._rideons = 0
+        if rideons > self._rideons:
+            events.append((EVENT_ZWIFT_RIDE_ON, {
+                'player_id': player_id,
+                'rideons': rideons,
+                'count': rideons - self._rideons,
+            }))
+        self._rideons = rideons
+
+        if level is not None and self._level is not None and level > self._level:
+            events.append((EVENT_ZWIFT_LEVEL_UP, {
+                'player_id': player_id,
+                'level': level,
+                'previous_level': self._level,
+            }))
+        if level is not None:
+            self._level = level
+
+        if riding and distance is not None:
+            self._distance = distance
+            milestone = int(distance // self.milestone_distance)
+            if self._milestone is None:
+                self._milestone = milestone
+            elif milestone > self._milestone:
+                self._milestone = milestone
+                events.append((EVENT_ZWIFT_DISTANCE_MILESTONE, {
+                    'player_id': player_id,
+                    'distance': milestone * self.milestone_distance,
+                }))
+        return events
+
+
+def _merge(event_type, pending, event_data):
+    """Fold an event into a pending one of the same kind."""
+    if event_type == EVENT_ZWIFT_RIDE_ON:
+        event_data = dict(event_data, count=pending['count'] + event_data['count'])
+    elif event_type == EVENT_ZWIFT_LEVEL_UP:
+        event_data = dict(event_data, previous_level=pending['previous_level'])
+    return event_data
+
+
+class EventDebouncer:
+    """Collect events for `delay` seconds and fire one per kind and player."""
+
+    def __init__(self, hass, delay=DEBOUNCE_DELAY):
+        self.hass = hass
+        self.delay = delay
+        self._pending = {}
+        self._unsub = None
+
+    @callback
+    def async_add(self, event_type, event_data):
+        # started and ended share a key so a flapping ride cancels out
+        kind = _RIDE if event_type in (EVENT_ZWIFT_RIDE_STARTED, EVENT_ZWIFT_RIDE_ENDED) \
+            else event_type
+        key = (event_data['player_id'], kind)
+        pending = self._pending.get(key)
+        if pending is not None:
+            pending_type, pending_data = pending
+            if kind == _RIDE and pending_type != event_type:
+                del self._pending[key]
+                return
+            event_data = _merge(event_type, pending_data, event_data)
+        self._pending[key] = (event_type, event_data)
+        if self._unsub is None:
+            self._unsub = async_call_later(self.hass, self.delay, self._async_fire)
+
+    @callback
+    def _async_fire(self, now=None):
+        self._unsub = None
+        pending, self._pending = self._pending, {}
+        for event_type, event_data in pending.values():
+            self.hass.bus.async_fire(event_type, event_data)
+
+    @callback
+    def async_stop(self):
+        """Fire whatever is still pending."""
+        if self._unsub is not None:
+            self._unsub()
+        self._async_fire()
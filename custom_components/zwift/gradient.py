@@ -0,0 +1,112 @@
+"""Road gradient estimation from distance/altitude samples."""
+
+import math
+from array import array
+
+DEFAULT_WINDOW = 200.0
+DEFAULT_CAPACITY = 64
+MIN_SAMPLES = 2
+
+
+class GradientEstimator:
+    """Least-squares slope of altitude over the last `window` metres.
+
+    Samples live in a fixed-size ring buffer and the regression sums are
+    maintained incrementally, so adding a sample is O(1) amortised. The sums
+    are rebuilt from the buffer every `capacity` samples to stop floating
+    point drift from accumulating over long rides.
+
+    Distances and altitudes must both be in metres for the gradient to come
+    out in percent:
+
+    >>> estimator = GradientEstimator(window=1000.0)
+    >>> for metres in range(0, 1001, 50):
+    ...     _ = estimator.add(metres, 100.0 + 0.05 * metres)
+    >>> round(estimator.gradient, 1)
+    5.0
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, capacity=DEFAULT_CAPACITY):
+        self.window = window
+        self.capacity = capacity
+        self._x = array('d', bytes(8 * capacity))
+        self._y = array('d', bytes(8 * capacity))
+        self.reset()
+
+    def reset(self):
+        self._start = 0
+        self._end = 0
+        self._since_rebuild = 0
+        self._sx = self._sy = self._sxx = self._sxy = self._syy = 0.0
+
+    @property
+    def samples(self):
+        return self._end - self._start
+
+    def _accumulate(self, index, sign):
+        x = self._x[index % self.capacity]
+        y = self._y[index % self.capacity]
+        self._sx += sign * x
+        self._sy += sign * y
+        self._sxx += sign * x * x
+        self._sxy += sign * x * y
+        self._syy += sign * y * y
+
+    def add(self, distance, altitude):
+        """Add a sample (both in metres); non-advancing distances are ignored."""
+        if self.samples and distance <= self._x[(self._end - 1) % self.capacity]:
+            return False
+        while self._start < self._end and (
+                self.samples >= self.capacity or
+                self._x[self._start % self.capacity] < distance - self.window):
+            self._accumulate(self._start, -1)
+            self._start += 1
+        slot = self._end % self.capacity
+        self._x[slot] = distance
+        self._y[slot] = altitude
+        self._accumulate(self._end, 1)
+        self._end += 1
+        self._since_rebuild += 1
+        if self._since_rebuild >= self.capacity:
+            self._rebuild()
+        return True
+
+    def _rebuild(self):
+        self._sx = self._sy = self._sxx = self._sxy = self._syy = 0.0
+        for index in range(self._start, self._end):
+            self._accumulate(index, 1)
+        self._since_rebuild = 0
+
+    def _centered_sums(self):
+        n = self.samples
+        sxx = self._sxx - self._sx * self._sx / n
+        sxy = self._sxy - self._sx * self._sy / n
+        syy = self._syy - self._sy * self._sy / n
+        return n, sxx, sxy, syy
+
+    @property
+    def gradient(self):
+        """Current gradient in percent, or None without enough samples."""
+        if self.samples < MIN_SAMPLES:
+            return None
+        _, sxx, sxy, _ = self._centered_sums()
+        if sxx <= 0:
+            return None
+        return 100.0 * sxy / sxx
+
+    @property
+    def confidence(self):
+        """A 0-1 score combining window coverage and the slope's standard error."""
+        if self.samples < MIN_SAMPLES:
+            return 0.0
+        n, sxx, sxy, syy = self._centered_sums()
+        if sxx <= 0:
+            return 0.0
+        span = (self._x[(self._end - 1) % self.capacity] -
+                self._x[self._start % self.capacity])
+        coverage = min(span / self.window, 1.0)
+        if n <= 2:
+            return round(coverage * 0.5, 2)
+        sse = max(syy - sxy * sxy / sxx, 0.0)
+        standard_error = 100.0 * math.sqrt(sse / (n - 2) / sxx)
+        return round(coverage / (1.0 + standard_error), 2)
@@ -0,0 +1,142 @@
+"""
+Group and nearby-rider analytics from one snapshot of a world.
+
+Riders on the same road going the same way form a lane. Each lane is
+sorted once by road position in the direction of travel and the distance
+between neighbours is accumulated, after which the gap between any two
+riders is a subtraction and "everyone within N meters" is two bisects.
+A world snapshot of n riders therefore costs O(n log n), however many of
+them are tracked.
+
+Distances are the straight-line distance between consecutive riders,
+which follows the road closely at the spacing that matters here. Time gaps
+use the speed of the trailing rider.
+"""
+
+import math
+from bisect import bisect_left, bisect_right
+
+# meters around a rider that count as nearby
+NEARBY_DISTANCE = 200
+# consecutive riders at most this many seconds (or meters, when stopped)
+# apart ride in the same group
+GROUP_TIME_GAP = 2
+GROUP_DISTANCE_GAP = 10
+
+
+class RiderPosition:
+    """Where a rider is in a world, as far as group analytics care."""
+
+    __slots__ = ('player_id', 'road_id', 'road_time', 'forward', 'x', 'y', 'speed', 'seen')
+
+    def __init__(self, player_id, road_id, road_time, forward, x, y, speed, seen=None):
+        self.player_id = player_id
+        self.road_id = road_id
+        self.road_time = road_time
+        self.forward = forward
+        self.x = x
+        self.y = y
+        self.speed = speed
+        self.seen = seen
+
+    @classmethod
+    def from_state(cls, player_state, seen=None):
+        position = cls(str(player_state.id), 0, 0, True, 0.0, 0.0, 0)
+        position.update(player_state, seen)
+        return position
+
+    def update(self, player_state, seen=None):
+        """Refresh from a PlayerState, which may be a reused record."""
+        self.road_id = player_state.road_id
+        self.road_time = player_state.roadTime
+        self.forward = player_state.is_forward
+        self.x = player_state.x
+        self.y = player_state.y
+        self.speed = player_state.speed
+        self.seen = seen
+
+    @property
+    def meters_per_second(self):
+        # relay speed is in millimeters per hour
+        return self.speed / 3600000.0
+
+
+def _time_gap(distance, trailing):
+    speed = trailing.meters_per_second
+    if speed <= 0:
+        return None
+    return round(abs(distance) / speed, 1)
+
+
+def _neighbour(rider, distance, trailing):
+    if rider is None:
+        return None
+    return {
+        'player_id': rider.player_id,
+        'distance': round(abs(distance), 1),
+        'time': _time_gap(distance, trailing),
+    }
+
+
+def analyze_lane(riders, tracked_ids, results):
+    """Analyze riders sharing a road and direction, adding to `results`."""
+    # index grows in the direction of travel, the last rider leads
+    riders.sort(key=lambda rider: rider.road_time, reverse=not riders[0].forward)
+    positions = [0.0]
+    for previous, rider in zip(riders, riders[1:]):
+        positions.append(positions[-1] + math.hypot(
+            rider.x - previous.x, rider.y - previous.y) / 100.0)
+
+    groups = [0]
+    for index in range(1, len(riders)):
+        gap = positions[index] - positions[index - 1]
+        time_gap = _time_gap(gap, riders[index - 1])
+        same_group = gap <= GROUP_DISTANCE_GAP or (
+            time_gap is not None and time_gap <= GROUP_TIME_GAP)
+        groups.append(groups[-1] if same_group else groups[-1] + 1)
+    group_start = {}
+    group_end = {}
+    for index, group in enumerate(groups):
+        group_start.setdefault(group, index)
+        group_end[group] = index
+
+    tracked = [index for index, rider in enumerate(riders) if rider.player_id in tracked_ids]
+    for index in tracked:
+        rider = riders[index]
+        position = positions[index]
+        group = groups[index]
+        nearby = bisect_right(positions, position + NEARBY_DISTANCE) - \
+            bisect_left(positions, position - NEARBY_DISTANCE) - 1
+        ahead = riders[index + 1] if index + 1 < len(riders) else None
+        behind = riders[index - 1] if index > 0 else None
+        results[rider.player_id] = {
+            'riders_nearby': nearby,
+            'group_size': group_end[group] - group_start[group] + 1,
+            'group_position': group_end[group] - index + 1,
+            'ahead': _neighbour(ahead, positions[index + 1] - position if ahead else 0, rider),
+            'behind': _neighbour(behind, position - positions[index - 1] if behind else 0, behind),
+            # positive distances are ahead of this rider
+            'tracked': {
+                riders[other].player_id: {
+                    'distance': round(positions[other] - position, 1),
+                    'time': _time_gap(positions[other] - position,
+                                      rider if other > index else riders[other]),
+                }
+                for other in tracked if other != index},
+        }
+
+
+def analyze(positions, tracked_ids):
+    """Group stats for every tracked rider found in a world snapshot.
+
+    `positions` is an iterable of RiderPosition, `tracked_ids` a set of
+    player ids as strings. Returns a dict keyed by tracked player id.
+    """
+    lanes = {}
+    for rider in positions:
+        lanes.setdefault((rider.road_id, rider.forward), []).append(rider)
+    results = {}
+    for riders in lanes.values():
+        if any(rider.player_id in tracked_ids for rider in riders):
+            analyze_lane(riders, tracked_ids, results)
+    return results
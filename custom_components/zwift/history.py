@@ -0,0 +1,309 @@
+"""
+Append-only on-disk ride history.
+
+Every ride of a tracked player is stored in its own directory:
+
+    <config>/.storage/zwift_history/<player_id>/<activity_id>/
+        meta.json
+        time.bin        float64 seconds (relay world time)
+        power.bin       float32, one file per telemetry field
+        ...
+
+Columns are raw arrays in native byte order, so a reader can mmap a single
+column without parsing anything, and writers only ever append. Samples are
+buffered in memory and flushed from the executor every `FLUSH_INTERVAL`
+seconds and when a ride ends. Old rides are pruned by count and age.
+"""
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import shutil
+import time
+from array import array
+
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import STORAGE_DIR
+
+from .telemetry import FIELDS, MAX_SAMPLE_DURATION
+
+_LOGGER = logging.getLogger(__name__)
+
+HISTORY_DIR = 'zwift_history'
+META_FILE = 'meta.json'
+TIME_COLUMN = 'time'
+COLUMN_SUFFIX = '.bin'
+
+DEFAULT_MAX_ACTIVITIES = 50
+DEFAULT_RETENTION_DAYS = 90
+FLUSH_INTERVAL = 30
+
+POWER_CURVE_DURATIONS = (1, 5, 10, 30, 60, 300, 600, 1200, 3600)
+
+
+class _ActivityWriter:
+    """In-memory tail of an activity that has not been written out yet."""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.meta_dirty = True
+        self.times = array('d')
+        self.columns = {field: array('f') for field in FIELDS}
+
+    def drain(self):
+        """Hand over the buffered samples and start a new buffer."""
+        meta = dict(self.meta) if self.meta_dirty else None
+        self.meta_dirty = False
+        times, columns = self.times, self.columns
+        self.times = array('d')
+        self.columns = {field: array('f') for field in FIELDS}
+        return self.path, meta, times, columns
+
+
+class _MappedColumns:
+    """Read-only memory maps of an activity's column files."""
+
+    def __init__(self, path, fields):
+        self._maps = []
+        self.columns = {}
+        typecodes = {TIME_COLUMN: 'd'}
+        for field in (TIME_COLUMN,) + tuple(fields):
+            self.columns[field] = self._map(
+                os.path.join(path, field + COLUMN_SUFFIX), typecodes.get(field, 'f'))
+        # a crash mid-flush can leave columns of different lengths
+        self.length = min(len(column) for column in self.columns.values())
+
+    def _map(self, path, typecode):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        itemsize = array(typecode).itemsize
+        size -= size % itemsize
+        if not size:
+            return array(typecode)
+        with open(path, 'rb') as column_file:
+            mapped = mmap.mmap(column_file.fileno(), size, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped).cast(typecode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        for column in self.columns.values():
+            if isinstance(column, memoryview):
+                column.release()
+        for mapped in self._maps:
+            mapped.close()
+
+
+def power_curve(times, power, durations=POWER_CURVE_DURATIONS):
+    """Best mean power for each duration, treating samples as steps."""
+    count = len(times)
+    energy = array('d', bytes(8 * (count + 1)))
+    ends = array('d', bytes(8 * (count + 1)))
+    total = 0.0
+    elapsed = times[0] if count else 0.0
+    for index in range(count):
+        step = (times[index + 1] - times[index]) if index + 1 < count else 1.0
+        step = min(max(step, 0.0), MAX_SAMPLE_DURATION)
+        total += power[index] * step
+        elapsed += step
+        energy[index + 1] = total
+        ends[index + 1] = elapsed
+    ends[0] = times[0] if count else 0.0
+
+    curve = {}
+    for duration in durations:
+        best = None
+        end = 0
+        for start in range(count):
+            if end < start + 1:
+                end = start + 1
+            while end < count and ends[end] - ends[start] < duration:
+                end += 1
+            span = ends[end] - ends[start]
+            if span < duration:
+                break
+            mean = (energy[end] - energy[start]) / span
+            if best is None or mean > best:
+                best = mean
+        curve[duration] = round(best, 1) if best is not None else None
+    return curve
+
+
+class RideHistory:
+    """Per-rider, per-activity telemetry store."""
+
+    def __init__(self, hass, max_activities=DEFAULT_MAX_ACTIVITIES,
+                 retention_days=DEFAULT_RETENTION_DAYS, root=None):
+        self.hass = hass
+        self.root = root or hass.config.path(STORAGE_DIR, HISTORY_DIR)
+        self.max_activities = max_activities
+        self.retention_days = retention_days
+        self._writers = {}
+        self._closed = []
+        self._unsub_flush = None
+        self._flush_lock = asyncio.Lock()
+
+    def _player_path(self, player_id):
+        return os.path.join(self.root, str(player_id))
+
+    @callback
+    def async_start_activity(self, player_id, timestamp, meta=None):
+        """Start a new activity for a player, closing any open one."""
+        self.async_end_activity(player_id)
+        activity_id = str(int(timestamp))
+        activity_meta = {
+            'player_id': str(player_id),
+            'activity_id': activity_id,
+            'started': time.time(),
+            'world_time_start': timestamp,
+            'ended': None,
+        }
+        activity_meta.update(meta or {})
+        self._writers[player_id] = _ActivityWriter(
+            os.path.join(self._player_path(player_id), activity_id), activity_meta)
+        return activity_id
+
+    @callback
+    def async_append(self, player_id, timestamp, values):
+        writer = self._writers.get(player_id)
+        if writer is None:
+            return
+        writer.times.append(timestamp)
+        for field, column in writer.columns.items():
+            column.append(values.get(field, 0.0))
+        self._schedule_flush()
+
+    @callback
+    def async_end_activity(self, player_id):
+        writer = self._writers.pop(player_id, None)
+        if writer is None:
+            return
+        writer.meta['ended'] = time.time()
+        writer.meta_dirty = True
+        self._closed.append(writer)
+        self.hass.async_create_task(self.async_flush())
+
+    def _schedule_flush(self):
+        if self._unsub_flush is None:
+            self._unsub_flush = async_call_later(
+                self.hass, FLUSH_INTERVAL, self._async_scheduled_flush)
+
+    async def _async_scheduled_flush(self, now):
+        self._unsub_flush = None
+        await self.async_flush()
+
+    async def async_flush(self):
+        """Write every buffered sample to disk."""
+        async with self._flush_lock:
+            chunks = [writer.drain() for writer in self._writers.values()]
+            closed, self._closed = self._closed, []
+            chunks.extend(writer.drain() for writer in closed)
+            prune = {os.path.dirname(writer.path) for writer in closed}
+            if not chunks:
+                return
+            active = {writer.path for writer in self._writers.values()}
+            try:
+                await self.hass.async_add_executor_job(
+                    self._write, chunks, prune, active)
+            except OSError as e:
+                _LOGGER.warning("Could not write Zwift ride history: {}".format(e))
+
+    async def async_stop(self):
+        if self._unsub_flush is not None:
+            self._unsub_flush()
+            self._unsub_flush = None
+        for player_id in list(self._writers):
+            self.async_end_activity(player_id)
+        await self.async_flush()
+
+    def _write(self, chunks, prune, active):
+        for path, meta, times, columns in chunks:
+            os.makedirs(path, exist_ok=True)
+            if meta is not None:
+                meta_path = os.path.join(path, META_FILE)
+                with open(meta_path + '.tmp', 'w') as meta_file:
+                    json.dump(meta, meta_file)
+                os.replace(meta_path + '.tmp', meta_path)
+            if not times:
+                continue
+            with open(os.path.join(path, TIME_COLUMN + COLUMN_SUFFIX), 'ab') as column_file:
+                times.tofile(column_file)
+            for field, column in columns.items():
+                with open(os.path.join(path, field + COLUMN_SUFFIX), 'ab') as column_file:
+                    column.tofile(column_file)
+        for player_path in prune:
+            self._prune(player_path, active)
+
+    def _prune(self, player_path, active):
+        activities = self._list_activities(player_path)
+        cutoff = time.time() - self.retention_days * 86400
+        for index, meta in enumerate(activities):
+            path = os.path.join(player_path, meta['activity_id'])
+            if path in active:
+                continue
+            if index >= self.max_activities or (meta.get('started') or 0) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _list_activities(self, player_path):
+        """Metadata of every stored activity, newest first."""
+        activities = []
+        try:
+            entries = os.listdir(player_path)
+        except OSError:
+            return activities
+        for entry in entries:
+            try:
+                with open(os.path.join(player_path, entry, META_FILE)) as meta_file:
+                    activities.append(json.load(meta_file))
+            except (OSError, ValueError):
+                continue
+        activities.sort(key=lambda meta: meta.get('world_time_start') or 0, reverse=True)
+        return activities
+
+    def list_activities(self, player_id):
+        return self._list_activities(self._player_path(player_id))
+
+    def power_curve(self, player_id, activity_id, durations=POWER_CURVE_DURATIONS):
+        """Power curve of a stored activity, or None when it does not exist."""
+        path = os.path.join(self._player_path(player_id), str(activity_id))
+        if not os.path.isdir(path):
+            return None
+        with _MappedColumns(path, ('power',)) as mapped:
+            # unflushed or missing columns are empty arrays, not memoryviews
+            times = mapped.columns[TIME_COLUMN][:mapped.length]
+            power = mapped.columns['power'][:mapped.length]
+            try:
+                return power_curve(times, power, durations)
+            finally:
+                for column in (times, power):
+                    if isinstance(column, memoryview):
+                        column.release()
+
+    async def async_list_activities(self, player_id):
+        await self.async_flush()
+        return await self.hass.async_add_executor_job(self.list_activities, player_id)
+
+    async def async_power_curve(self, player_id, activity_id=None,
+                                durations=POWER_CURVE_DURATIONS):
+        """Power curve of an activity, the latest one when no id is given.
+
+        The curve is None when the activity, or any activity of the player
+        when no id is given, is not stored.
+        """
+        await self.async_flush()
+        if activity_id is None:
+            activities = await self.async_list_activities(player_id)
+            if not activities:
+                return None, None
+            activity_id = activities[0]['activity_id']
+        curve = await self.hass.async_add_executor_job(
+            self.power_curve, player_id, activity_id, durations)
+        return activity_id, curve
@@ -0,0 +1,140 @@
+"""
+Timings and counters for the polling pipeline.
+
+Every stage keeps its call count, total time and the latest `SAMPLE_SIZE`
+durations, which is plenty for stable p50/p95 figures at a poll every
+couple of seconds while staying constant in size. Request rates are
+counted over the last `RATE_WINDOW` seconds, per player and overall.
+"""
+
+import math
+import time
+from collections import Counter, deque
+
+STAGE_AUTH = 'auth'
+STAGE_PROFILE = 'profile'
+STAGE_PLAYER_STATE = 'player_state'
+STAGE_DECODE = 'decode'
+STAGE_DISPATCH = 'dispatch'
+STAGE_CYCLE = 'cycle'
+
+STAGES = (STAGE_AUTH, STAGE_PROFILE, STAGE_PLAYER_STATE, STAGE_DECODE,
+          STAGE_DISPATCH, STAGE_CYCLE)
+
+SAMPLE_SIZE = 256
+RATE_WINDOW = 60
+
+
+class LatencyStats:
+    """Count, mean and percentiles of the recent durations of one stage."""
+
+    __slots__ = ('count', 'total', '_recent')
+
+    def __init__(self, size=SAMPLE_SIZE):
+        self.count = 0
+        self.total = 0.0
+        self._recent = deque(maxlen=size)
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self._recent.append(seconds)
+
+    def percentile(self, percent):
+        """Nearest-rank percentile of the recent durations, in seconds."""
+        if not self._recent:
+            return None
+        ordered = sorted(self._recent)
+        index = max(math.ceil(percent / 100.0 * len(ordered)) - 1, 0)
+        return ordered[min(index, len(ordered) - 1)]
+
+    def as_dict(self):
+        def ms(seconds):
+            return round(seconds * 1000, 1) if seconds is not None else None
+        return {
+            'count': self.count,
+            'mean_ms': ms(self.total / self.count) if self.count else None,
+            'p50_ms': ms(self.percentile(50)),
+            'p95_ms': ms(self.percentile(95)),
+        }
+
+
+class _StageTimer:
+    __slots__ = ('_stats', '_started')
+
+    def __init__(self, stats):
+        self._stats = stats
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stats.record(time.perf_counter() - self._started)
+
+
+class PipelineMetrics:
+    """Stage timings and request counters of one ZwiftData."""
+
+    def __init__(self):
+        self.stages = {stage: LatencyStats() for stage in STAGES}
+        self.requests = 0
+        self.statuses = Counter()
+        self.errors = 0
+        self._request_times = deque()
+        self._player_request_times = {}
+
+    def time(self, stage):
+        """Context manager timing one run of a stage."""
+        return _StageTimer(self.stages[stage])
+
+    def count_request(self, status, player_id=None, now=None):
+        if now is None:
+            now = time.monotonic()
+        self.requests += 1
+        self.statuses[status] += 1
+        self._request_times.append(now)
+        self._expire(self._request_times, now)
+        if player_id is not None:
+            times = self._player_request_times.setdefault(str(player_id), deque())
+            times.append(now)
+            self._expire(times, now)
+
+    def count_error(self):
+        self.errors += 1
+
+    @staticmethod
+    def _expire(times, now):
+        limit = now - RATE_WINDOW
+        while times and times[0] <= limit:
+            times.popleft()
+
+    def request_rate(self, now=None):
+        """Requests per minute over the last `RATE_WINDOW` seconds."""
+        if now is None:
+            now = time.monotonic()
+        self._expire(self._request_times, now)
+        return len(self._request_times) * 60.0 / RATE_WINDOW
+
+    def player_request_rates(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        rates = {}
+        for player_id, times in self._player_request_times.items():
+            self._expire(times, now)
+            rates[player_id] = len(times) * 60.0 / RATE_WINDOW
+        return rates
+
+    @property
+    def failed_requests(self):
+        return sum(count for status, count in self.statuses.items() if status >= 400)
+
+    def as_dict(self, now=None):
+        return {
+            'stages': {stage: stats.as_dict() for stage, stats in self.stages.items()},
+            'requests': self.requests,
+            'requests_per_minute': self.request_rate(now),
+            'player_requests_per_minute': self.player_request_rates(now),
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+            'errors': self.errors,
+        }
@@ -0,0 +1,198 @@
+"""
+Compact Zwift profiles and the attributes projected from them.
+
+A Zwift profile is a large JSON document of which the integration reads a
+dozen fields. Instead of keeping every document around, profiles are
+turned into slotted records holding those fields plus whatever the online
+sensor's attribute projection asks for. The projection is a list of dotted
+paths into the profile (`latest_activity.` paths read the latest activity)
+and is compiled once per account: paths naming a field the record already
+holds read it from there, the rest are copied into a tuple when the
+profile is fetched.
+"""
+
+import json
+
+PROFILE_FIELDS = ('id', 'firstName', 'riding', 'worldId', 'world_name',
+                  'playerLevel', 'runLevel', 'cycleProgress', 'runProgress',
+                  'totalExperiencePoints')
+ACTIVITY_FIELDS = ('id', 'worldId', 'world_name', 'activityRideOnCount')
+
+LATEST_ACTIVITY = 'latest_activity'
+
+DEFAULT_PROFILE_ATTRIBUTES = [
+    'firstName',
+    'lastName',
+    'countryCode',
+    'riding',
+    'worldId',
+    'world_name',
+    'playerLevel',
+    'runLevel',
+    'cycleProgress',
+    'runProgress',
+    'ftp',
+    'weight',
+    'totalExperiencePoints',
+    'totalDistance',
+    'totalDistanceClimbed',
+    'totalTimeInMinutes',
+    'totalWattHours',
+    'socialFacts.followersCount',
+    'socialFacts.followeesCount',
+    'latest_activity.id',
+    'latest_activity.name',
+    'latest_activity.world_name',
+    'latest_activity.startDate',
+    'latest_activity.endDate',
+    'latest_activity.distanceInMeters',
+    'latest_activity.avgWatts',
+    'latest_activity.totalElevation',
+    'latest_activity.calories',
+    'latest_activity.activityRideOnCount',
+]
+
+# sources of a projected value
+_PROFILE = 0
+_PROFILE_EXTRA = 1
+_ACTIVITY = 2
+_ACTIVITY_EXTRA = 3
+_ACTIVITY_ALL = 4
+
+
+def _lookup(document, keys):
+    for key in keys:
+        if not isinstance(document, dict):
+            return None
+        document = document.get(key)
+    return document
+
+
+class _Record:
+    """Read access with the dict API the raw profiles used to offer."""
+
+    __slots__ = ()
+    _fields = ()
+
+    def get(self, key, default=None):
+        if key not in self._fields:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+
+class ActivityRecord(_Record):
+    """The latest activity of a profile."""
+
+    __slots__ = ACTIVITY_FIELDS + ('extras',)
+    _fields = ACTIVITY_FIELDS
+
+    def __init__(self, values, extras):
+        for name, value in zip(ACTIVITY_FIELDS, values):
+            setattr(self, name, value)
+        self.extras = extras
+
+    def signature(self):
+        return tuple(getattr(self, name) for name in ACTIVITY_FIELDS) + self.extras
+
+
+class ProfileRecord(_Record):
+    """The fields of a profile the integration and its projection use."""
+
+    __slots__ = PROFILE_FIELDS + (LATEST_ACTIVITY, 'extras', 'projection')
+    _fields = PROFILE_FIELDS + (LATEST_ACTIVITY,)
+
+    def __init__(self, values, latest_activity, extras, projection):
+        for name, value in zip(PROFILE_FIELDS, values):
+            setattr(self, name, value)
+        self.latest_activity = latest_activity
+        self.extras = extras
+        self.projection = projection
+
+    def signature(self):
+        """Everything the record holds, for change detection."""
+        return tuple(getattr(self, name) for name in PROFILE_FIELDS) + \
+            self.latest_activity.signature() + self.extras
+
+    def content_hash(self):
+        signature = self.signature()
+        try:
+            return hash(signature)
+        except TypeError:
+            # projected values may be lists or dicts
+            return hash(json.dumps(signature, sort_keys=True, default=str))
+
+    def as_attributes(self):
+        return self.projection.attributes(self)
+
+
+class ProfileProjection:
+    """A compiled list of profile attribute paths."""
+
+    def __init__(self, paths=DEFAULT_PROFILE_ATTRIBUTES):
+        self.paths = tuple(paths)
+        self._profile_extras = []
+        self._activity_extras = []
+        self._getters = []
+        for path in self.paths:
+            keys = tuple(path.split('.'))
+            if keys[0] == LATEST_ACTIVITY:
+                rest = keys[1:]
+                if not rest:
+                    getter = (_ACTIVITY_ALL, None)
+                elif len(rest) == 1 and rest[0] in ACTIVITY_FIELDS:
+                    getter = (_ACTIVITY, rest[0])
+                else:
+                    getter = (_ACTIVITY_EXTRA, len(self._activity_extras))
+                    self._activity_extras.append(rest)
+            elif len(keys) == 1 and keys[0] in PROFILE_FIELDS:
+                getter = (_PROFILE, keys[0])
+            else:
+                getter = (_PROFILE_EXTRA, len(self._profile_extras))
+                self._profile_extras.append(keys)
+            self._getters.append((keys, getter))
+
+    def record(self, profile, latest_activity):
+        """Build a ProfileRecord from a processed profile and its latest activity."""
+        latest_activity = latest_activity or {}
+        activity = ActivityRecord(
+            tuple(latest_activity.get(name) for name in ACTIVITY_FIELDS),
+            tuple(_lookup(latest_activity, keys) for keys in self._activity_extras))
+        return ProfileRecord(
+            tuple(profile.get(name) for name in PROFILE_FIELDS), activity,
+            tuple(_lookup(profile, keys) for keys in self._profile_extras), self)
+
+    def _value(self, record, getter):
+        source, key = getter
+        if source == _PROFILE:
+            return getattr(record, key)
+        if source == _PROFILE_EXTRA:
+            return record.extras[key]
+        activity = record.latest_activity
+        if source == _ACTIVITY:
+            return getattr(activity, key)
+        if source == _ACTIVITY_EXTRA:
+            return activity.extras[key]
+        return {name: getattr(activity, name) for name in ACTIVITY_FIELDS
+                if getattr(activity, name) is not None}
+
+    def attributes(self, record):
+        """The projected attributes of a record, nested like the profile."""
+        attributes = {}
+        for keys, getter in self._getters:
+            value = self._value(record, getter)
+            if value is None:
+                continue
+            target = attributes
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+                if not isinstance(target, dict):
+                    break
+            else:
+                target[keys[-1]] = value
+        return attributes
@@ -0,0 +1,95 @@
+"""Client-side rate limiting for Zwift API requests."""
+
+import asyncio
+import email.utils
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_RATE = 5.0
+DEFAULT_MIN_RATE = 0.2
+DEFAULT_BURST = 10
+# additive increase per successful request, in requests/second
+DEFAULT_INCREASE = 0.05
+# multiplicative decrease applied on every 429
+DEFAULT_DECREASE = 0.5
+
+
+def parse_retry_after(value, now=None):
+    """Return the number of seconds a Retry-After header asks us to wait.
+
+    Both the delay-seconds and HTTP-date forms are supported; anything
+    unparseable yields None.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    if now is None:
+        now = time.time()
+    return max(retry_at.timestamp() - now, 0.0)
+
+
+class RateLimiter:
+    """Token bucket shared by all Zwift API requests.
+
+    The refill rate is adjusted AIMD style: every successful request nudges
+    it up by `increase` towards `max_rate`, every 429 multiplies it by
+    `decrease` (never below `min_rate`) and empties the bucket. A
+    Retry-After hint blocks all requests until it has passed.
+    """
+
+    def __init__(self, max_rate=DEFAULT_MAX_RATE, burst=DEFAULT_BURST,
+                 min_rate=DEFAULT_MIN_RATE, increase=DEFAULT_INCREASE,
+                 decrease=DEFAULT_DECREASE):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.rate = max_rate
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait until a request may be sent."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                await asyncio.sleep(wait)
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttled(self, retry_after=None):
+        now = time.monotonic()
+        self._refill(now)
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self._tokens = 0.0
+        if retry_after:
+            self._blocked_until = max(self._blocked_until, now + retry_after)
+        _LOGGER.debug("throttled by Zwift, request rate lowered to {:.2f}/s{}".format(
+            self.rate, ' for {}s'.format(retry_after) if retry_after else ''))
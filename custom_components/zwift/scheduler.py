@@ -0,0 +1,96 @@
+"""Per-player poll scheduling for the Zwift sensor platform."""
+
+import heapq
+import itertools
+
+PROFILE = 'profile'
+STATE = 'state'
+
+
+class PlayerScheduler:
+    """Priority queue of per-player poll deadlines.
+
+    Riding players have their live state polled every `online_interval` and
+    their profile every `profile_interval`. Offline players only have their
+    profile polled, backing off exponentially from `online_interval` up to
+    `offline_interval`. All times are in seconds on a monotonic clock.
+    """
+
+    def __init__(self, online_interval, offline_interval, profile_interval):
+        self.online_interval = online_interval
+        self.offline_interval = offline_interval
+        self.profile_interval = profile_interval
+        self._queue = []
+        self._due = {}
+        self._backoff = {}
+        self._counter = itertools.count()
+
+    def add(self, player_id, now):
+        """Start tracking a player, with its profile due immediately."""
+        self._backoff[player_id] = self.online_interval
+        self._push(player_id, PROFILE, now)
+
+    def remove(self, player_id):
+        self._backoff.pop(player_id, None)
+        self._due.pop((player_id, PROFILE), None)
+        self._due.pop((player_id, STATE), None)
+
+    def _push(self, player_id, kind, when):
+        self._due[(player_id, kind)] = when
+        heapq.heappush(
+            self._queue, (when, next(self._counter), player_id, kind))
+
+    def _prune(self):
+        """Drop heap entries that were superseded or cancelled."""
+        while self._queue:
+            when, _, player_id, kind = self._queue[0]
+            if self._due.get((player_id, kind)) == when:
+                return
+            heapq.heappop(self._queue)
+
+    def next_due(self):
+        """Return the earliest deadline, or None if nothing is scheduled."""
+        self._prune()
+        return self._queue[0][0] if self._queue else None
+
+    def pop_due(self, now, slack=0):
+        """Pop everything due by `now + slack`.
+
+        Returns a `(profile_ids, state_ids)` tuple of sets. Popped players
+        must be handed back through `reschedule` once they have been polled.
+        """
+        due = {PROFILE: set(), STATE: set()}
+        while True:
+            self._prune()
+            if not self._queue or self._queue[0][0] > now + slack:
+                break
+            _, _, player_id, kind = heapq.heappop(self._queue)
+            del self._due[(player_id, kind)]
+            due[kind].add(player_id)
+        return due[PROFILE], due[STATE]
+
+    def expedite(self, player_id, kind, when):
+        """Schedule a poll at `when` unless one is already due sooner."""
+        if player_id not in self._backoff:
+            return
+        due = self._due.get((player_id, kind))
+        if due is None or due > when:
+            self._push(player_id, kind, when)
+
+    def reschedule(self, player_id, now, riding, profile=False, state=False):
+        """Queue the next polls for a player after a profile and/or state poll."""
+        if player_id not in self._backoff:
+            return
+        if riding:
+            self._backoff[player_id] = self.online_interval
+            if profile:
+                self.expedite(player_id, PROFILE, now + self.profile_interval)
+            if state or (player_id, STATE) not in self._due:
+                self._push(player_id, STATE, now + self.online_interval)
+        else:
+            self._due.pop((player_id, STATE), None)
+            if profile:
+                interval = self._backoff[player_id]
+                self.expedite(player_id, PROFILE, now + interval)
+                self._backoff[player_id] = min(
+                    interval * 2, self.offline_interval)
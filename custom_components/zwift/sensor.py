@@ -15,38 +15,58 @@ sensor:
 
 """
 
+import asyncio
+import hashlib
 import logging
-import sys
-import threading
 import time
 from datetime import timedelta
 
 import homeassistant.helpers.config_validation as cv
 import voluptuous as vol
 from homeassistant.components.sensor import PLATFORM_SCHEMA
-from homeassistant.const import (CONF_NAME, CONF_PASSWORD, CONF_USERNAME,
+from homeassistant.const import (ATTR_DEVICE_CLASS, ATTR_FRIENDLY_NAME,
+                                 ATTR_ICON, ATTR_UNIT_OF_MEASUREMENT,
+                                 CONF_HOST, CONF_NAME, CONF_PASSWORD,
+                                 CONF_PORT, CONF_PROTOCOL, CONF_USERNAME,
                                  EVENT_HOMEASSISTANT_START,
-                                 EVENT_HOMEASSISTANT_STOP)
-from homeassistant.core import callback
-from homeassistant.helpers.aiohttp_client import SERVER_SOFTWARE
+                                 EVENT_HOMEASSISTANT_STOP, STATE_ON,
+                                 STATE_UNAVAILABLE, STATE_UNKNOWN)
+from homeassistant.core import SupportsResponse, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.aiohttp_client import (SERVER_SOFTWARE,
+                                                  async_get_clientsession)
 from homeassistant.helpers.dispatcher import (async_dispatcher_connect,
-                                              dispatcher_send)
+                                              async_dispatcher_send)
 from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.event import async_call_later
-
-# we need to patch the zwift protobuf as the upstream
-# library has not yet been updated (9/16/2023)
-from .zwift_patch import zwift_messages_pb2 as new_pb2
-
-sys.modules['zwift.zwift_messages_pb2'] = new_pb2
-# evil patch ends here
-
-from zwift import Client as ZwiftClient
-from zwift.error import RequestException
+from homeassistant.helpers.restore_state import RestoreEntity
+
+# protobuf is only imported once the first relay payload is decoded,
+# see decoder.py
+from .api import DEFAULT_MAX_CONCURRENCY, RequestException, ZwiftApiClient
+from .auth import TokenManager
+from .cache import TTLCache
+from .decoder import DecodeError
+from .events import EventDebouncer, RideEventDetector
+from .gradient import GradientEstimator
+from .groups import RiderPosition
+from .groups import analyze as analyze_groups
+from .history import (DEFAULT_MAX_ACTIVITIES, DEFAULT_RETENTION_DAYS,
+                      POWER_CURVE_DURATIONS, RideHistory)
+from .metrics import (STAGE_CYCLE, STAGE_DISPATCH, STAGE_PLAYER_STATE,
+                      STAGE_PROFILE, PipelineMetrics)
+from .profile import DEFAULT_PROFILE_ATTRIBUTES, ProfileProjection
+from .ratelimit import DEFAULT_MAX_RATE, RateLimiter
+from .scheduler import PROFILE, PlayerScheduler
+from .stream import DEFAULT_PORTS as DEFAULT_STREAM_PORTS
+from .stream import PROTOCOL_TCP, PROTOCOL_UDP, RelayStream
+from .telemetry import FIELDS as TELEMETRY_FIELDS
+from .telemetry import TelemetryBuffer
+from .worlds import WorldIndexes
 
 _LOGGER = logging.getLogger(__name__)
 
-REQUIREMENTS = ['zwift-client==0.2.0']
+REQUIREMENTS = ['protobuf>=3.20']
 
 try:
     from homeassistant.components.binary_sensor import BinarySensorEntity
@@ -54,34 +74,80 @@ except ImportError:
     from homeassistant.components.binary_sensor import \
         BinarySensorDevice as BinarySensorEntity
 
+try:
+    from homeassistant.const import EntityCategory
+except ImportError:
+    from homeassistant.helpers.entity import EntityCategory
+
 CONF_UPDATE_INTERVAL = 'update_interval'
+CONF_PROFILE_UPDATE_INTERVAL = 'profile_update_interval'
+CONF_PROFILE_CACHE_TTL = 'profile_cache_ttl'
+CONF_PROFILE_ATTRIBUTES = 'profile_attributes'
 CONF_PLAYERS = 'players'
 CONF_INCLUDE_SELF = 'include_self'
-
+CONF_MAX_CONCURRENCY = 'max_concurrency'
+CONF_MAX_REQUEST_RATE = 'max_request_rate'
+CONF_BATCH_WORLD_STATES = 'batch_world_states'
+CONF_STREAM = 'stream'
+CONF_HISTORY = 'history'
+CONF_MAX_ACTIVITIES = 'max_activities'
+CONF_RETENTION_DAYS = 'retention_days'
+
+DOMAIN = 'zwift'
 DATA_ZWIFT = 'zwift'
+DATA_ZWIFT_HISTORY = 'zwift_history'
+
+SERVICE_LIST_ACTIVITIES = 'list_activities'
+SERVICE_POWER_CURVE = 'power_curve'
+SERVICE_GET_DIAGNOSTICS = 'get_diagnostics'
+ATTR_PLAYER_ID = 'player_id'
+ATTR_ACTIVITY_ID = 'activity_id'
+ATTR_DURATIONS = 'durations'
 
 DEFAULT_NAME = 'Zwift'
 
-SIGNAL_ZWIFT_UPDATE = 'zwift_update_{player_id}'
-
-EVENT_ZWIFT_RIDE_ON = 'zwift_ride_on'
-
-ZWIFT_IGNORED_PROFILE_ATTRIBUTES = [
-    'privateAttributes',
-    'publicAttributes',
-    'connectedToStrava',
-    'connectedToTrainingPeaks',
-    'connectedToTodaysPlan',
-    'connectedToUnderArmour',
-    'connectedToWithings',
-    'connectedToFitbit',
-    'connectedToGarmin',
-    'connectedToRuntastic',
-    'mixpanelDistinctId',
-    'bigCommerceId',
-    'avantlinkId',
-    'userAgent',
-    'launchedGameClient'
+DEFAULT_ONLINE_UPDATE_INTERVAL = timedelta(seconds=2)
+DEFAULT_PROFILE_CACHE_TTL = timedelta(seconds=60)
+
+# polls due within this many seconds of each other are batched together
+SCHEDULER_SLACK = 0.5
+MIN_UPDATE_DELAY = 0.1
+# riders not seen in a world snapshot for this long are left out of groups
+POSITION_MAX_AGE = 10
+
+SIGNAL_ZWIFT_FIELD_UPDATE = 'zwift_update_{player_id}_{field}'
+SIGNAL_ZWIFT_DIAGNOSTICS = 'zwift_diagnostics_{account}'
+
+# diagnostic sensors are refreshed at most this often
+DIAGNOSTICS_UPDATE_INTERVAL = 30
+
+ONLINE_GROUP_ATTRIBUTES = ('riders_nearby', 'group_size', 'group_position')
+
+# attributes that rarely change are left out of the recorder's history
+UNRECORDED_PROFILE_ATTRIBUTES = frozenset({
+    'firstName',
+    'lastName',
+    'countryCode',
+    'ftp',
+    'weight',
+    'playerLevel',
+    'runLevel',
+    'cycleProgress',
+    'runProgress',
+    'totalExperiencePoints',
+    'totalDistance',
+    'totalDistanceClimbed',
+    'totalTimeInMinutes',
+    'totalWattHours',
+    'socialFacts',
+    'latest_activity',
+})
+
+RESTORE_IGNORED_ATTRIBUTES = [
+    ATTR_DEVICE_CLASS,
+    ATTR_FRIENDLY_NAME,
+    ATTR_ICON,
+    ATTR_UNIT_OF_MEASUREMENT,
 ]
 
 ZWIFT_WORLDS = {
@@ -98,6 +164,33 @@ ZWIFT_WORLDS = {
     11: "Paris"
 }
 
+STREAM_SCHEMA = vol.Schema({
+    vol.Required(CONF_HOST): cv.string,
+    vol.Optional(CONF_PORT): cv.port,
+    vol.Optional(CONF_PROTOCOL, default=PROTOCOL_TCP): vol.In([PROTOCOL_TCP, PROTOCOL_UDP]),
+})
+
+HISTORY_SCHEMA = vol.Schema({
+    vol.Optional(CONF_MAX_ACTIVITIES, default=DEFAULT_MAX_ACTIVITIES): (
+        vol.All(vol.Coerce(int), vol.Range(min=1))),
+    vol.Optional(CONF_RETENTION_DAYS, default=DEFAULT_RETENTION_DAYS): (
+        vol.All(vol.Coerce(int), vol.Range(min=1))),
+})
+
+# ids name directories of the history store, so nothing but digits
+HISTORY_ID = vol.All(cv.string, vol.Match(r'^[0-9]+$'))
+
+LIST_ACTIVITIES_SCHEMA = vol.Schema({
+    vol.Required(ATTR_PLAYER_ID): HISTORY_ID,
+})
+
+POWER_CURVE_SCHEMA = vol.Schema({
+    vol.Required(ATTR_PLAYER_ID): HISTORY_ID,
+    vol.Optional(ATTR_ACTIVITY_ID): HISTORY_ID,
+    vol.Optional(ATTR_DURATIONS, default=list(POWER_CURVE_DURATIONS)): (
+        vol.All(cv.ensure_list, [vol.All(vol.Coerce(int), vol.Range(min=1))])),
+})
+
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Required(CONF_USERNAME): cv.string,
     vol.Required(CONF_PASSWORD): cv.string,
@@ -106,6 +199,19 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Optional(CONF_NAME, default=DEFAULT_NAME): cv.string,
     vol.Optional(CONF_UPDATE_INTERVAL, default=timedelta(seconds=15)): (
         vol.All(cv.time_period, cv.positive_timedelta)),
+    vol.Optional(CONF_PROFILE_UPDATE_INTERVAL): (
+        vol.All(cv.time_period, cv.positive_timedelta)),
+    vol.Optional(CONF_PROFILE_CACHE_TTL, default=DEFAULT_PROFILE_CACHE_TTL): (
+        vol.All(cv.time_period, cv.positive_timedelta)),
+    vol.Optional(CONF_PROFILE_ATTRIBUTES, default=DEFAULT_PROFILE_ATTRIBUTES): (
+        vol.All(cv.ensure_list, [cv.string])),
+    vol.Optional(CONF_MAX_CONCURRENCY, default=DEFAULT_MAX_CONCURRENCY): (
+        vol.All(vol.Coerce(int), vol.Range(min=1))),
+    vol.Optional(CONF_MAX_REQUEST_RATE, default=DEFAULT_MAX_RATE): (
+        vol.All(vol.Coerce(float), vol.Range(min=0.1))),
+    vol.Optional(CONF_BATCH_WORLD_STATES, default=False): cv.boolean,
+    vol.Optional(CONF_STREAM): STREAM_SCHEMA,
+    vol.Optional(CONF_HISTORY): HISTORY_SCHEMA,
 })
 
 SENSOR_TYPES = {
@@ -114,13 +220,31 @@ SENSOR_TYPES = {
     'speed': {'name': 'Speed', 'unit': 'mph', 'unit_metric': 'kmh', 'icon': 'mdi:speedometer'},
     'cadence': {'name': 'Cadence', 'unit': 'rpm', 'icon': 'mdi:rotate-right'},
     'power': {'name': 'Power', 'unit': 'W', 'icon': 'mdi:flash'},
-    'altitude': {'name': 'Altitude', 'unit': 'ft', 'unit_metric': 'cm', 'icon': 'mdi:altimeter'},
+    'altitude': {'name': 'Altitude', 'unit': 'm', 'icon': 'mdi:altimeter'},
     'distance': {'name': 'Distance', 'unit': 'miles', 'unit_metric': 'm', 'icon': 'mdi:arrow-expand-horizontal'},
     'gradient': {'name': 'Gradient', 'unit': '%', 'icon': 'mdi:image-filter-hdr'},
     'level': {'name': 'Level', 'icon': 'mdi:stairs'},
     'runlevel': {'name': 'Run Level', 'icon': 'mdi:run-fast'},
     'cycleprogress': {'name': 'Cycle Progress', 'unit': '%', 'icon': 'mdi:transfer-right'},
     'runprogress': {'name': 'Run Progress', 'unit': '%', 'icon': 'mdi:transfer-right'},
+    'power3s': {'name': 'Power 3s', 'unit': 'W', 'icon': 'mdi:flash'},
+    'power10s': {'name': 'Power 10s', 'unit': 'W', 'icon': 'mdi:flash'},
+    'power30s': {'name': 'Power 30s', 'unit': 'W', 'icon': 'mdi:flash'},
+    'hr30s': {'name': 'Heart Rate 30s', 'unit': 'bpm', 'icon': 'mdi:heart-pulse'},
+    'normalizedpower': {'name': 'Normalized Power', 'unit': 'W', 'icon': 'mdi:flash-outline'},
+    'bestpower5s': {'name': 'Best Power 5s', 'unit': 'W', 'icon': 'mdi:trophy'},
+    'bestpower1m': {'name': 'Best Power 1m', 'unit': 'W', 'icon': 'mdi:trophy'},
+    'bestpower5m': {'name': 'Best Power 5m', 'unit': 'W', 'icon': 'mdi:trophy'},
+    'bestpower20m': {'name': 'Best Power 20m', 'unit': 'W', 'icon': 'mdi:trophy'},
+    'location': {'name': 'Location', 'icon': 'mdi:map-marker'},
+    'route': {'name': 'Route Progress', 'unit': '%', 'icon': 'mdi:map-marker-path'},
+    'nearby': {'name': 'Nearby Riders', 'icon': 'mdi:account-group'},
+}
+
+DIAGNOSTIC_SENSOR_TYPES = {
+    'cycletime': {'name': 'Cycle Time', 'unit': 'ms', 'icon': 'mdi:timer-outline'},
+    'requestrate': {'name': 'Request Rate', 'unit': 'requests/min', 'icon': 'mdi:swap-vertical'},
+    'requesterrors': {'name': 'Request Errors', 'icon': 'mdi:alert-circle-outline'},
 }
 
 
@@ -132,50 +256,178 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
     players = config.get(CONF_PLAYERS)
     name = config.get(CONF_NAME)
     update_interval = config.get(CONF_UPDATE_INTERVAL)
+    profile_update_interval = config.get(
+        CONF_PROFILE_UPDATE_INTERVAL, update_interval)
+    profile_cache_ttl = config.get(CONF_PROFILE_CACHE_TTL)
+    profile_attributes = config.get(CONF_PROFILE_ATTRIBUTES)
     include_self = config.get(CONF_INCLUDE_SELF)
-
-    zwift_data = ZwiftData(update_interval, username, password, players, hass)
-    try:
-        await zwift_data._connect()
-    except:
-        _LOGGER.exception(
-            "Could not create Zwift sensor named '{}'!".format(name))
+    max_concurrency = config.get(CONF_MAX_CONCURRENCY)
+    max_request_rate = config.get(CONF_MAX_REQUEST_RATE)
+    batch_world_states = config.get(CONF_BATCH_WORLD_STATES)
+    setup_started = time.monotonic()
+
+    # one ZwiftData per account, shared by every platform entry using it
+    accounts = hass.data.setdefault(DATA_ZWIFT, {})
+    zwift_data = accounts.get(username)
+    if zwift_data is None:
+        zwift_data = ZwiftData(update_interval, username, password, [], hass,
+                               max_concurrency=max_concurrency,
+                               max_request_rate=max_request_rate,
+                               batch_world_states=batch_world_states,
+                               profile_update_interval=profile_update_interval,
+                               profile_cache_ttl=profile_cache_ttl,
+                               profile_attributes=profile_attributes)
+        accounts[username] = zwift_data
+
+        @callback
+        def async_stop_zwift_data(event):
+            zwift_data.async_stop()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_stop_zwift_data)
+        async_add_entities([ZwiftDiagnosticSensor(name, zwift_data, variable)
+                            for variable in DIAGNOSTIC_SENSOR_TYPES])
+        _async_setup_diagnostics_service(hass)
+
+    if config.get(CONF_HISTORY) is not None and zwift_data.history is None:
+        zwift_data.history = _async_setup_history(hass, config[CONF_HISTORY])
+
+    # entities are registered straight away from stored data and restored
+    # state; logging in and the first poll happen in the background
+    await zwift_data.async_load()
+
+    player_ids = list(players)
+    self_id = zwift_data.self_player_id
+    if include_self and self_id:
+        player_ids.insert(0, self_id)
+
+    known = set()
+
+    @callback
+    def async_add_players(player_ids):
+        dev = []
+        for player_id in player_ids:
+            player = _async_track_player(hass, zwift_data, player_id)
+            if player is None or str(player.player_id) in known:
+                continue
+            known.add(str(player.player_id))
+            for variable in SENSOR_TYPES:
+                if SENSOR_TYPES[variable].get('binary'):
+                    dev.append(ZwiftBinarySensorDevice(name, zwift_data,
+                               player, variable))
+                else:
+                    dev.append(ZwiftSensorDevice(name, zwift_data,
+                               player, variable))
+        if dev:
+            async_add_entities(dev)
+
+    async_add_players(player_ids)
+    _LOGGER.debug("Zwift sensor named '{}' registered {} players in {:.3f}s".format(
+        name, len(known), time.monotonic() - setup_started))
+
+    @callback
+    def async_connected():
+        """Finish what needs the account's profile, whenever we get it."""
+        if include_self:
+            async_add_players([zwift_data.self_player_id])
+        stream = config.get(CONF_STREAM)
+        if stream and zwift_data._stream is None:
+            protocol = stream[CONF_PROTOCOL]
+            zwift_data.async_start_stream(
+                stream[CONF_HOST],
+                stream.get(CONF_PORT, DEFAULT_STREAM_PORTS[protocol]),
+                protocol)
+
+    zwift_data.async_on_connect(async_connected)
+
+    async def async_finish_setup():
+        try:
+            await zwift_data.async_connect()
+        except Exception:
+            _LOGGER.exception(
+                "Could not connect Zwift sensor named '{}', will retry".format(name))
+        await zwift_data.async_start_polling()
+        zwift_data.startup_time = time.monotonic() - setup_started
+        _LOGGER.info("Zwift sensor named '{}' completed its first update {:.3f}s after setup started".format(
+            name, zwift_data.startup_time))
+
+    hass.async_create_background_task(
+        async_finish_setup(), 'zwift setup {}'.format(name))
+
+
+@callback
+def _async_setup_diagnostics_service(hass):
+    if hass.services.has_service(DOMAIN, SERVICE_GET_DIAGNOSTICS):
         return
 
-    if include_self:
-        zwift_data.add_tracked_player(zwift_data._profile.get('id'))
-
-    async def update_data(now):
-        if zwift_data._client is None:
-            await zwift_data._connect()
-        await hass.async_add_executor_job(zwift_data.update)
+    async def async_get_diagnostics(call):
+        return {'accounts': [zwift_data.diagnostics()
+                             for zwift_data in hass.data[DATA_ZWIFT].values()]}
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_GET_DIAGNOSTICS, async_get_diagnostics,
+        supports_response=SupportsResponse.ONLY)
+
+
+@callback
+def _async_setup_history(hass, config):
+    """Return the ride history store, creating it and its services once."""
+    history = hass.data.get(DATA_ZWIFT_HISTORY)
+    if history is not None:
+        return history
+    history = hass.data[DATA_ZWIFT_HISTORY] = RideHistory(
+        hass, config[CONF_MAX_ACTIVITIES], config[CONF_RETENTION_DAYS])
+
+    async def async_stop_history(event):
+        await history.async_stop()
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_stop_history)
+
+    async def async_list_activities(call):
+        return {'activities': await history.async_list_activities(
+            call.data[ATTR_PLAYER_ID])}
+
+    async def async_power_curve(call):
+        activity_id, curve = await history.async_power_curve(
+            call.data[ATTR_PLAYER_ID], call.data.get(ATTR_ACTIVITY_ID),
+            call.data[ATTR_DURATIONS])
+        if curve is None:
+            if activity_id is None:
+                raise HomeAssistantError("No stored Zwift activities for player {}".format(
+                    call.data[ATTR_PLAYER_ID]))
+            raise HomeAssistantError("No stored Zwift activity {} for player {}".format(
+                activity_id, call.data[ATTR_PLAYER_ID]))
+        return {'activity_id': activity_id,
+                'power_curve': {str(duration): watts for duration, watts in curve.items()}}
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_LIST_ACTIVITIES, async_list_activities,
+        schema=LIST_ACTIVITIES_SCHEMA, supports_response=SupportsResponse.ONLY)
+    hass.services.async_register(
+        DOMAIN, SERVICE_POWER_CURVE, async_power_curve,
+        schema=POWER_CURVE_SCHEMA, supports_response=SupportsResponse.ONLY)
+    return history
+
+
+@callback
+def _async_track_player(hass, zwift_data, player_id):
+    """Return the data object for a player, tracking it if nobody does yet.
+
+    A player already polled by any account is shared rather than fetched a
+    second time; updates reach every entity through the per-player signals.
+    """
+    if not player_id:
+        return None
+    for other in hass.data[DATA_ZWIFT].values():
+        player = other.get_player(player_id)
+        if player is not None:
+            return player
+    zwift_data.add_tracked_player(player_id)
+    return zwift_data.get_player(player_id)
+
+
+class ZwiftSensorDevice(RestoreEntity):
+    _unrecorded_attributes = UNRECORDED_PROFILE_ATTRIBUTES
 
-        next_update = zwift_data.update_interval
-        if zwift_data.any_players_online:
-            next_update = zwift_data.online_update_interval
-
-        async_call_later(
-            hass,
-            next_update.total_seconds(),
-            update_data
-        )
-
-    await update_data(None)
-
-    dev = []
-    for player_id in zwift_data.players:
-        for variable in SENSOR_TYPES:
-            if SENSOR_TYPES[variable].get('binary'):
-                dev.append(ZwiftBinarySensorDevice(name, zwift_data,
-                           zwift_data.players[player_id], variable))
-            else:
-                dev.append(ZwiftSensorDevice(name, zwift_data,
-                           zwift_data.players[player_id], variable))
-
-    async_add_entities(dev, True)
-
-
-class ZwiftSensorDevice(Entity):
     def __init__(self, name, zwift_data, player, sensor_type):
         """Initialize the sensor."""
         self._base_name = name
@@ -184,6 +436,7 @@ class ZwiftSensorDevice(Entity):
         self._type = sensor_type
         self._state = None
         self._attrs = {}
+        self._profile_hash = None
         self._unique_id = "{}_{}_{}".format(self._base_name, SENSOR_TYPES[self._type].get(
             'name'), self._player.player_id).replace(" ", "").lower()
 
@@ -223,22 +476,52 @@ class ZwiftSensorDevice(Entity):
     def icon(self):
         return SENSOR_TYPES[self._type].get('icon')
 
+    @property
+    def should_poll(self):
+        """Updates are pushed by ZwiftData when the value changes."""
+        return False
+
+    def _restore_state(self, last_state):
+        self._state = last_state.state
+        self._attrs = {k: v for k, v in last_state.attributes.items()
+                       if k not in RESTORE_IGNORED_ATTRIBUTES}
+
     def update(self):
         """Get the latest data from the sensor."""
         self._state = getattr(self._player, self._type)
-        if self._type == 'online':
-            p = self._player.player_profile
-            self._attrs.update(
-                {k: p[k] for k in p if k not in ZWIFT_IGNORED_PROFILE_ATTRIBUTES})
+        if self._type == 'online' and self._profile_hash != self._player.profile_hash:
+            self._profile_hash = self._player.profile_hash
+            player_profile = self._player.player_profile
+            self._attrs = player_profile.as_attributes() if player_profile else {}
+        attributes = self._player.extra_attributes(self._type)
+        if attributes is not None:
+            if self._type == 'online':
+                self._attrs.update(attributes)
+            else:
+                self._attrs = attributes
 
     async def async_added_to_hass(self):
-        """Register update signal handler."""
-        async def async_update_state():
+        """Take the player's data or restore the last state, and register for updates."""
+        await super().async_added_to_hass()
+        # unchanged fields are not dispatched again, so an entity added after
+        # its player was published has to catch up by itself
+        if self._player.has_data:
+            self.update()
+        elif self._state is None:
+            last_state = await self.async_get_last_state()
+            if last_state is not None and last_state.state not in (STATE_UNKNOWN, STATE_UNAVAILABLE):
+                self._restore_state(last_state)
+
+        @callback
+        def async_update_state():
             """Update sensor state."""
-            await self.async_update_ha_state(True)
+            self.update()
+            self.async_write_ha_state()
 
-        async_dispatcher_connect(self.hass, SIGNAL_ZWIFT_UPDATE.format(
-            player_id=self._player.player_id), async_update_state)
+        self.async_on_remove(async_dispatcher_connect(
+            self.hass, SIGNAL_ZWIFT_FIELD_UPDATE.format(
+                player_id=self._player.player_id, field=self._type),
+            async_update_state))
 
 
 class ZwiftBinarySensorDevice(ZwiftSensorDevice, BinarySensorEntity):
@@ -247,17 +530,167 @@ class ZwiftBinarySensorDevice(ZwiftSensorDevice, BinarySensorEntity):
         """Return true if the binary sensor is on."""
         return self._state
 
+    def _restore_state(self, last_state):
+        super()._restore_state(last_state)
+        self._state = last_state.state == STATE_ON
+
     @property
     def device_class(self):
         """Return the device class of the binary sensor."""
         return SENSOR_TYPES[self._type].get('device_class')
 
 
+class ZwiftDiagnosticSensor(Entity):
+    """Timings and request counters of the polling loop of one account."""
+
+    def __init__(self, name, zwift_data, sensor_type):
+        self._base_name = name
+        self._zwift_data = zwift_data
+        self._type = sensor_type
+        self._state = None
+        self._attrs = {}
+        self._unique_id = "{}_{}_{}".format(
+            self._base_name, DIAGNOSTIC_SENSOR_TYPES[self._type].get('name'),
+            zwift_data.account_id).replace(" ", "").lower()
+
+    @property
+    def unique_id(self):
+        """Return a unique ID."""
+        return self._unique_id
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return "{} {}".format(self._base_name, DIAGNOSTIC_SENSOR_TYPES[self._type].get('name'))
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+        return self._attrs
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self._state
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit this state is expressed in."""
+        return DIAGNOSTIC_SENSOR_TYPES[self._type].get('unit')
+
+    @property
+    def icon(self):
+        return DIAGNOSTIC_SENSOR_TYPES[self._type].get('icon')
+
+    @property
+    def entity_category(self):
+        return EntityCategory.DIAGNOSTIC
+
+    @property
+    def should_poll(self):
+        """Updates are pushed by ZwiftData after a polling cycle."""
+        return False
+
+    def update(self):
+        """Get the latest figures from the account's metrics."""
+        metrics = self._zwift_data.metrics
+        if self._type == 'cycletime':
+            stages = {stage: stats.as_dict() for stage, stats in metrics.stages.items()}
+            self._state = stages[STAGE_CYCLE]['p50_ms']
+            self._attrs = {
+                '{}_{}'.format(stage, key): value
+                for stage, stats in stages.items()
+                for key, value in stats.items() if key in ('p50_ms', 'p95_ms')}
+        elif self._type == 'requestrate':
+            self._state = round(metrics.request_rate(), 1)
+            self._attrs = {'player_{}'.format(player_id): round(rate, 1)
+                           for player_id, rate in metrics.player_request_rates().items()}
+            self._attrs['requests'] = metrics.requests
+        elif self._type == 'requesterrors':
+            self._state = metrics.failed_requests + metrics.errors
+            self._attrs = {'status_{}'.format(status): count
+                           for status, count in metrics.statuses.items() if status >= 400}
+            self._attrs['errors'] = metrics.errors
+
+    async def async_added_to_hass(self):
+        """Register update signal handler."""
+        @callback
+        def async_update_state():
+            """Update sensor state."""
+            self.update()
+            self.async_write_ha_state()
+
+        self.async_on_remove(async_dispatcher_connect(
+            self.hass, SIGNAL_ZWIFT_DIAGNOSTICS.format(account=self._zwift_data.account_id),
+            async_update_state))
+
+
 class ZwiftPlayerData:
     def __init__(self, player_id):
         self._player_id = player_id
         self.data = {}
         self.player_profile = {}
+        self.profile_hash = None
+        self.telemetry = TelemetryBuffer()
+        self.gradient_estimator = GradientEstimator()
+        self.event_detector = RideEventDetector(player_id)
+        self._published = {}
+
+    def set_profile(self, player_profile):
+        """Store a profile, returning True if its contents changed."""
+        if player_profile is self.player_profile:
+            return False
+        self.player_profile = player_profile
+        profile_hash = player_profile.content_hash()
+        if profile_hash == self.profile_hash:
+            return False
+        self.profile_hash = profile_hash
+        return True
+
+    def changed_fields(self, profile_changed=False):
+        """Return the sensor types whose value changed since the last call."""
+        changed = []
+        for sensor_type in SENSOR_TYPES:
+            value = getattr(self, sensor_type)
+            attributes = self.extra_attributes(sensor_type)
+            if attributes is not None:
+                value = (value, attributes)
+            if sensor_type not in self._published or self._published[sensor_type] != value:
+                self._published[sensor_type] = value
+                changed.append(sensor_type)
+        if profile_changed and 'online' not in changed:
+            changed.append('online')
+        return changed
+
+    def extra_attributes(self, sensor_type):
+        """Attributes for sensor types other than online, or None."""
+        if sensor_type == 'gradient':
+            return {
+                'confidence': self.gradient_estimator.confidence if self.online else 0.0,
+                'samples': self.gradient_estimator.samples,
+            }
+        if sensor_type == 'location':
+            return dict(self.data.get('location', {}))
+        if sensor_type == 'route':
+            return {
+                'route_id': self.data.get('route_id'),
+                'route_name': self.data.get('route_name'),
+            }
+        if sensor_type == 'nearby':
+            group = self.data.get('group') or {}
+            return {k: v for k, v in group.items() if k != 'riders_nearby'}
+        if sensor_type == 'online':
+            # only the summary, gaps change with every sample
+            group = self.data.get('group')
+            if group is not None:
+                group = {k: group[k] for k in ONLINE_GROUP_ATTRIBUTES}
+            return {'group': group}
+        return None
+
+    @property
+    def has_data(self):
+        """Whether an update was applied, i.e. the fields hold live values."""
+        return bool(self.player_profile)
 
     @property
     def player_id(self):
@@ -299,6 +732,23 @@ class ZwiftPlayerData:
     def gradient(self):
         return round(self.data.get('gradient', 0.0), 1)
 
+    @property
+    def location(self):
+        if not self.online:
+            return None
+        return self.data.get('segment') or self.data.get('world_name')
+
+    @property
+    def route(self):
+        return self.data.get('route_progress')
+
+    @property
+    def nearby(self):
+        group = self.data.get('group')
+        if not self.online or not group:
+            return None
+        return group['riders_nearby']
+
     @property
     def level(self):
         return self.player_profile.get('playerLevel', None)
@@ -315,36 +765,119 @@ class ZwiftPlayerData:
     def runprogress(self):
         return self.player_profile.get('runProgress', None)
 
+    def _rolling_mean(self, field, window):
+        if not self.online:
+            return 0.0
+        mean = self.telemetry.rolling_mean(field, window)
+        return round(mean, 0) if mean is not None else None
+
+    def _best_effort(self, window):
+        best = self.telemetry.best_efforts[window]
+        return round(best, 0) if best is not None else None
+
+    @property
+    def power3s(self):
+        return self._rolling_mean('power', 3)
+
+    @property
+    def power10s(self):
+        return self._rolling_mean('power', 10)
+
+    @property
+    def power30s(self):
+        return self._rolling_mean('power', 30)
+
+    @property
+    def hr30s(self):
+        return self._rolling_mean('heartrate', 30)
+
+    @property
+    def normalizedpower(self):
+        normalized_power = self.telemetry.normalized_power
+        return round(normalized_power, 0) if normalized_power is not None else None
+
+    @property
+    def bestpower5s(self):
+        return self._best_effort(5)
+
+    @property
+    def bestpower1m(self):
+        return self._best_effort(60)
+
+    @property
+    def bestpower5m(self):
+        return self._best_effort(300)
+
+    @property
+    def bestpower20m(self):
+        return self._best_effort(1200)
+
 
 class ZwiftData:
     """Representation of a Zwift client data collection object."""
 
-    def __init__(self, update_interval, username, password, players, hass):
-        self._client = None
+    def __init__(self, update_interval, username, password, players, hass,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, max_request_rate=DEFAULT_MAX_RATE,
+                 batch_world_states=False,
+                 profile_update_interval=None,
+                 profile_cache_ttl=DEFAULT_PROFILE_CACHE_TTL,
+                 profile_attributes=DEFAULT_PROFILE_ATTRIBUTES):
+        self._connected = False
+        self.batch_world_states = batch_world_states
+        self._unbatched_worlds = set()
+        self.metrics = PipelineMetrics()
+        self._diagnostics_published = None
+        session = async_get_clientsession(hass)
+        self._auth = TokenManager(hass, session, username, password, self.metrics)
+        self._api = ZwiftApiClient(
+            session, self._auth.async_get_access_token,
+            max_concurrency, RateLimiter(max_request_rate), self.metrics)
         self.username = username
         self.password = password
         self.hass = hass
         self.players = {}
+        self._player_keys = {}
+        self._stream = None
+        self._stream_task = None
+        self._streamed_at = {}
         self._profile = None
+        self._connect_lock = asyncio.Lock()
+        self._connect_callbacks = []
+        self._polling = False
+        self.startup_time = None
         self.update_interval = update_interval
-        self.online_update_interval = timedelta(seconds=2)
+        self._scheduler = PlayerScheduler(
+            DEFAULT_ONLINE_UPDATE_INTERVAL.total_seconds(),
+            update_interval.total_seconds(),
+            (profile_update_interval or update_interval).total_seconds())
+        self._profile_cache = TTLCache(profile_cache_ttl.total_seconds())
+        self._projection = ProfileProjection(profile_attributes)
+        self._events = EventDebouncer(hass)
+        self._worlds = WorldIndexes(hass)
+        self._world_positions = {}
+        self._groups = {}
+        self.history = None
         if players:
             for player_id in players:
                 self.add_tracked_player(player_id)
 
+    def get_player(self, player_id):
+        player_key = self._player_keys.get(str(player_id))
+        if player_key is None:
+            return None
+        return self.players[player_key]
+
     def add_tracked_player(self, player_id):
         if player_id:
             self.players[player_id] = ZwiftPlayerData(player_id)
+            self._player_keys[str(player_id)] = player_id
+            self._scheduler.add(player_id, time.monotonic())
 
-    @property
-    def any_players_online(self):
-        return sum([p.online for p in self.players.values()]) > 0
-
-    async def check_zwift_auth(self, client):
-        token = await self.hass.async_add_executor_job(client.auth_token.fetch_token_data)
-        if 'error' in token:
-            raise Exception("Zwift authorization failed: {}".format(token))
-        return True
+    def seconds_until_next_update(self):
+        next_due = self._scheduler.next_due()
+        if next_due is None:
+            return self.update_interval.total_seconds()
+        return max(next_due - time.monotonic(), MIN_UPDATE_DELAY)
 
     @property
     def is_metric(self):
@@ -352,105 +885,432 @@ class ZwiftData:
             return self._profile.get('useMetric', False)
         return False
 
-    async def _connect(self):
-        client = ZwiftClient(self.username, self.password)
-        if await self.check_zwift_auth(client):
-            self._client = client
-            self._profile = await self.hass.async_add_executor_job(self._get_self_profile)
-            return self._client
+    async def async_connect(self):
+        """Connect unless another platform entry already did."""
+        async with self._connect_lock:
+            if not self._connected:
+                await self._connect()
+        return self._connected
+
+    @callback
+    def async_on_connect(self, connect_callback):
+        """Run a callback once connected, now if that already happened.
+
+        Setup may fail to connect and leave it to the polling loop, so
+        anything needing the account's own profile hooks in here.
+        """
+        if self._connected:
+            connect_callback()
+        else:
+            self._connect_callbacks.append(connect_callback)
+
+    async def async_start_polling(self):
+        """Start the polling loop, or just poll once if it is running."""
+        if self._polling:
+            await self.async_update()
+            return
+        self._polling = True
+        await self._async_poll(None)
+
+    async def _async_poll(self, now):
+        if not self._connected:
+            try:
+                await self.async_connect()
+            except Exception as e:
+                _LOGGER.warning("Could not connect to Zwift, will retry: {}".format(e))
+                async_call_later(
+                    self.hass, self.update_interval.total_seconds(), self._async_poll)
+                return
+        await self.async_update()
 
-    def _get_self_profile(self):
-        return self._client.get_profile().profile
+        async_call_later(
+            self.hass,
+            self.seconds_until_next_update(),
+            self._async_poll
+        )
 
-    def update(self):
-        if self._client:
-            world = self._client.get_world(1)
-            for player_id in self.players:
-                data = {}
-                online_player = {}
-                try:
+    async def async_load(self):
+        """Load tokens and the account's own player id stored by a previous run."""
+        await self._auth.async_load()
+        if self._profile is None and self._auth.profile.get('id'):
+            self._profile = dict(self._auth.profile)
 
-                    _profile = self._client.get_profile(player_id)
-                    player_profile = _profile.profile or {}
-                    _LOGGER.debug(
-                        "Zwift profile data: {}".format(player_profile))
-                    total_experience = int(
-                        player_profile.get('totalExperiencePoints'))
-                    player_profile['playerLevel'] = int(
-                        player_profile.get('achievementLevel', 0) / 100)
-                    player_profile['runLevel'] = int(
-                        player_profile.get('runAchievementLevel', 0) / 100)
-                    player_profile['cycleProgress'] = int(
-                        player_profile.get('achievementLevel', 0) % 100)
-                    player_profile['runProgress'] = int(
-                        player_profile.get('runAchievementLevel', 0) % 100)
-                    latest_activity = _profile.latest_activity
-                    latest_activity['world_name'] = ZWIFT_WORLDS.get(
-                        latest_activity.get('worldId'))
-                    player_profile['latest_activity'] = latest_activity
-
-                    data['total_experience'] = total_experience
-                    data['level'] = player_profile['playerLevel']
-                    player_profile['world_name'] = ZWIFT_WORLDS.get(
-                        player_profile.get('worldId'))
-
-                    if player_profile.get('riding'):
-                        player_state = world.player_status(player_id)
-                        _LOGGER.debug("Zwift player state data: {}".format(
-                            player_state.player_state))
-                        # [TODO] is this correct regardless of metric/imperial? Correct regardless of world?
-                        altitude = (float(player_state.altitude) - 9000) / 2
-                        distance = float(player_state.distance)
-                        gradient = self.players[player_id].data.get(
-                            'gradient', 0)
-                        rideons = latest_activity.get('activityRideOnCount', 0)
-                        if rideons > 0 and rideons > self.players[player_id].data.get('rideons', 0):
-                            self.hass.bus.fire(EVENT_ZWIFT_RIDE_ON, {
-                                'player_id': player_id,
-                                'rideons': rideons
-                            })
-                        if self.players[player_id].data.get('distance', 0) > 0:
-                            delta_distance = distance - \
-                                self.players[player_id].data.get('distance', 0)
-                            delta_altitude = altitude - \
-                                self.players[player_id].data.get('altitude', 0)
-                            if delta_distance > 0:
-                                gradient = delta_altitude / delta_distance
-                        data.update({
-                            'online': True,
-                            'heartrate': int(float(player_state.heartrate)),
-                            'cadence': int(float(player_state.cadence)),
-                            'power': int(float(player_state.power)),
-                            'speed': player_state.speed / 1000000.0,
-                            'altitude': altitude,
-                            'distance': distance,
-                            'gradient': gradient,
-                            'rideons': rideons
-                        })
-                    online_player.update(player_profile)
-                    self.players[player_id].player_profile = online_player
-                    self.players[player_id].data = data
-                except RequestException as e:
-                    if '401' in str(e):
-                        self._client = None
-                        _LOGGER.warning(
-                            'Zwift credentials are wrong or expired')
-                    elif '404' in str(e):
-                        _LOGGER.warning('Upstream Zwift 404 - will try later')
-                    elif '429' in str(e):
-                        current_interval = self.online_update_interval
-                        new_interval = self.online_update_interval + \
-                            timedelta(seconds=0.25)
-                        self.online_update_interval = new_interval
-                        _LOGGER.warning('Upstream request throttling 429 - known issue, increasing interval from {}s to {}s'.format(
-                            current_interval.total_seconds(), new_interval.total_seconds()))
-                    else:
+    @property
+    def account_id(self):
+        """A stable id for this account that does not reveal the username."""
+        return hashlib.sha1(self.username.encode()).hexdigest()[:12]
+
+    def diagnostics(self):
+        """Metrics and polling state of this account, for troubleshooting."""
+        now = time.monotonic()
+        return {
+            'account_id': self.account_id,
+            'connected': self._connected,
+            'startup_time': self.startup_time,
+            'players': len(self.players),
+            'players_online': sum(player.online for player in self.players.values()),
+            'streamed_players': sum(self._is_streamed(player_id, now) for player_id in self.players),
+            'request_rate_limit': self._api.rate_limiter.rate,
+            'metrics': self.metrics.as_dict(now),
+        }
+
+    @property
+    def self_player_id(self):
+        if self._profile:
+            return self._profile.get('id')
+        return None
+
+    async def _connect(self):
+        # stored tokens from a previous run spare us a password login
+        await self.async_load()
+        await self._auth.async_get_access_token()
+        self._profile = await self._api.get_profile('me')
+        await self._auth.async_save_profile(self._profile)
+        self._connected = True
+        connect_callbacks, self._connect_callbacks = self._connect_callbacks, []
+        for connect_callback in connect_callbacks:
+            connect_callback()
+
+    @callback
+    def async_stop(self):
+        self.async_stop_stream()
+        self._auth.async_stop()
+        self._events.async_stop()
+
+    async def async_update(self):
+        if not self._connected:
+            return
+        with self.metrics.time(STAGE_CYCLE):
+            await self._async_update()
+        now = time.monotonic()
+        if self._diagnostics_published is None or \
+                now - self._diagnostics_published >= DIAGNOSTICS_UPDATE_INTERVAL:
+            self._diagnostics_published = now
+            async_dispatcher_send(
+                self.hass, SIGNAL_ZWIFT_DIAGNOSTICS.format(account=self.account_id))
+
+    async def _async_update(self):
+        profile_ids, state_ids = self._scheduler.pop_due(
+            time.monotonic(), SCHEDULER_SLACK)
+        profile_ids &= self.players.keys()
+        state_ids &= self.players.keys()
+
+        player_ids = list(profile_ids)
+        profiles = await asyncio.gather(*[self._async_fetch_profile(player_id)
+                                          for player_id in player_ids])
+        profiles = {player_id: player_profile for player_id, player_profile
+                    in zip(player_ids, profiles) if player_profile is not None}
+        # players whose profile was not due reuse their last known profile
+        for player_id in state_ids - profile_ids:
+            if self.players[player_id].player_profile:
+                profiles[player_id] = self.players[player_id].player_profile
+        riding_profiles = {player_id: player_profile for player_id, player_profile
+                           in profiles.items() if player_profile.get('riding')}
+        # riders covered by the relay stream do not need a REST poll
+        now = time.monotonic()
+        player_states = await self._async_fetch_player_states(
+            {player_id: player_profile for player_id, player_profile
+             in riding_profiles.items() if not self._is_streamed(player_id, now)})
+
+        now = time.monotonic()
+        self._groups = self._analyze_groups(now)
+        for player_id in profile_ids | state_ids:
+            player_profile = profiles.get(player_id)
+            profile_changed = False
+            if player_profile is not None:
+                player_state = player_states.get(player_id)
+                if player_state is not None or not player_profile.get('riding'):
+                    try:
+                        profile_changed = self._apply_player_update(
+                            player_id, player_profile, player_state)
+                    except Exception:
                         _LOGGER.exception(
-                            'something went wrong in Zwift python library - {} while updating zwift sensor for player {}'.format(str(e), player_id))
+                            'something went major wrong while updating zwift sensor for player {}'.format(player_id))
+                elif self._is_streamed(player_id, now):
+                    profile_changed = self.players[player_id].set_profile(
+                        player_profile)
+            self._scheduler.reschedule(
+                player_id, now, self.players[player_id].online,
+                profile=player_id in profile_ids,
+                state=player_id in riding_profiles)
+            self._async_publish(player_id, profile_changed)
+
+    @callback
+    def _async_publish(self, player_id, profile_changed=False):
+        with self.metrics.time(STAGE_DISPATCH):
+            changed = self.players[player_id].changed_fields(profile_changed)
+            if not changed:
+                return
+            _LOGGER.debug(
+                "dispatching zwift data update for player %s: %s", player_id, changed)
+            for field in changed:
+                async_dispatcher_send(
+                    self.hass, SIGNAL_ZWIFT_FIELD_UPDATE.format(player_id=player_id, field=field))
+
+    def async_start_stream(self, host, port, protocol):
+        """Start receiving live player states pushed by a relay."""
+        rider_id = self._profile.get('id') if self._profile else None
+        self._stream = RelayStream(
+            host, port, protocol, rider_id, self._async_handle_streamed_state)
+        self._stream_task = self.hass.async_create_background_task(
+            self._stream.async_run(), 'zwift relay stream')
+
+    def async_stop_stream(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream_task.cancel()
+            self._stream = None
+
+    @callback
+    def _async_handle_streamed_state(self, player_state):
+        now = time.monotonic()
+        self._record_position(self._stream_world_id, player_state, now)
+        player_id = self._player_keys.get(str(player_state.id))
+        if player_id is None or not self.players[player_id].player_profile:
+            return
+        self._streamed_at[player_id] = now
+        profile_changed = False
+        try:
+            profile_changed = self._apply_player_update(
+                player_id, self.players[player_id].player_profile,
+                player_state)
+        except Exception:
+            _LOGGER.exception(
+                'something went major wrong while updating zwift sensor for player {}'.format(player_id))
+        self._async_publish(player_id, profile_changed)
+
+    @property
+    def _stream_world_id(self):
+        """The relay streams the world the account's own rider is in."""
+        player = self.get_player(self.self_player_id) if self.self_player_id else None
+        if player is not None and player.player_profile.get('worldId'):
+            return player.player_profile['worldId']
+        return 1
+
+    def _is_streamed(self, player_id, now):
+        streamed_at = self._streamed_at.get(player_id)
+        return streamed_at is not None and now - streamed_at < self._scheduler.online_interval * 2
+
+    async def _async_fetch_profile(self, player_id):
+        cached = self._profile_cache.get(player_id, time.monotonic())
+        # only riding players are served from the cache; for everyone else the
+        # profile poll is how we notice that they have started riding
+        if cached is not None and cached.get('riding'):
+            return cached
+        try:
+            with self.metrics.time(STAGE_PROFILE):
+                player_profile, latest_activity = await asyncio.gather(
+                    self._api.get_profile(player_id),
+                    self._api.get_latest_activity(player_id))
+            player_profile = player_profile or {}
+            # lazy arguments, profiles are large and this runs for every fetch
+            _LOGGER.debug("Zwift profile data: %s", player_profile)
+            player_profile['playerLevel'] = int(
+                player_profile.get('achievementLevel', 0) / 100)
+            player_profile['runLevel'] = int(
+                player_profile.get('runAchievementLevel', 0) / 100)
+            player_profile['cycleProgress'] = int(
+                player_profile.get('achievementLevel', 0) % 100)
+            player_profile['runProgress'] = int(
+                player_profile.get('runAchievementLevel', 0) % 100)
+            latest_activity = latest_activity or {}
+            latest_activity['world_name'] = self._world_name(
+                latest_activity.get('worldId'))
+            player_profile['world_name'] = self._world_name(
+                player_profile.get('worldId'))
+            player_profile = self._projection.record(player_profile, latest_activity)
+            self._profile_cache.set(player_id, player_profile, time.monotonic())
+            return player_profile
+        except Exception as e:
+            self._log_update_error(player_id, e)
+
+    async def _async_fetch_player_states(self, riding_profiles):
+        """Fetch live state for riding players, grouped by the world they are in."""
+        worlds = {}
+        for player_id, player_profile in riding_profiles.items():
+            world_id = player_profile.get('worldId') or 1
+            worlds.setdefault(world_id, []).append(player_id)
+
+        player_states = {}
+        for world_id, player_ids in worlds.items():
+            world_states = {}
+            if self.batch_world_states and world_id not in self._unbatched_worlds:
+                try:
+                    with self.metrics.time(STAGE_PLAYER_STATE):
+                        world_states = await self._api.get_world_player_states(world_id)
+                except DecodeError as e:
+                    # not a ServerToClient payload, asking again will not help
+                    self._unbatched_worlds.add(world_id)
+                    _LOGGER.warning(
+                        "Zwift world {} does not serve batched player states ({}), "
+                        "fetching its players one by one from now on".format(world_id, e))
                 except Exception as e:
-                    _LOGGER.exception(
-                        'something went major wrong while updating zwift sensor for player {}'.format(player_id))
-                _LOGGER.debug(
-                    "dispatching zwift data update for player {}".format(player_id))
-                dispatcher_send(
-                    self.hass, SIGNAL_ZWIFT_UPDATE.format(player_id=player_id))
+                    _LOGGER.debug(
+                        "batched player state fetch failed for world {}: {}".format(world_id, e))
+                else:
+                    for player_id in player_ids:
+                        if str(player_id) in world_states:
+                            player_states[player_id] = world_states[str(player_id)]
+            missing = [player_id for player_id in player_ids
+                       if player_id not in player_states]
+            results = await asyncio.gather(*[
+                self._async_fetch_player_state(world_id, player_id)
+                for player_id in missing])
+            player_states.update({player_id: player_state for player_id, player_state
+                                  in zip(missing, results) if player_state is not None})
+            now = time.monotonic()
+            for player_id in player_ids:
+                if player_id in player_states:
+                    self._record_position(world_id, player_states[player_id], now)
+            for player_state in world_states.values():
+                self._record_position(world_id, player_state, now)
+        return player_states
+
+    def _record_position(self, world_id, player_state, now):
+        positions = self._world_positions.setdefault(world_id, {})
+        position = positions.get(player_state.id)
+        if position is None:
+            positions[player_state.id] = RiderPosition.from_state(player_state, now)
+        else:
+            position.update(player_state, now)
+
+    def _analyze_groups(self, now):
+        """Group stats of every tracked rider from the latest world snapshots."""
+        tracked_ids = set(self._player_keys)
+        groups = {}
+        for positions in self._world_positions.values():
+            for rider_id in [rider_id for rider_id, position in positions.items()
+                             if now - position.seen > POSITION_MAX_AGE]:
+                del positions[rider_id]
+            groups.update(analyze_groups(positions.values(), tracked_ids))
+        return groups
+
+    async def _async_fetch_player_state(self, world_id, player_id):
+        try:
+            with self.metrics.time(STAGE_PLAYER_STATE):
+                return await self._api.get_player_state(world_id, player_id)
+        except RequestException as e:
+            if '404' in str(e):
+                # most likely no longer riding, go and check the profile
+                self._invalidate_profile(player_id)
+            self._log_update_error(player_id, e)
+        except Exception as e:
+            self._log_update_error(player_id, e)
+
+    def _world_name(self, world_id):
+        if world_id is None:
+            return None
+        index = self._worlds.get(world_id)
+        if index is not None and index.name:
+            return index.name
+        return ZWIFT_WORLDS.get(world_id)
+
+    def _locate(self, world_id, player_state, distance):
+        """Road position of a rider, with segment and route when the world is known."""
+        road_id = player_state.road_id
+        road_time = player_state.roadTime
+        forward = player_state.is_forward
+        location = {
+            'world_id': world_id,
+            'road_id': road_id,
+            'road_time': road_time,
+            'forward': forward,
+            'x': round(player_state.x, 1),
+            'y': round(player_state.y, 1),
+            'lap': player_state.laps,
+            'group_id': player_state.groupId or None,
+        }
+        located = {'location': location, 'world_name': self._world_name(world_id)}
+        index = self._worlds.get(world_id)
+        if index is not None:
+            segment = index.segment(road_id, road_time)
+            route_id, route_name, progress = index.route(
+                road_id, road_time, forward, distance)
+            location['segment'] = segment
+            located.update({
+                'segment': segment,
+                'route_id': route_id,
+                'route_name': route_name,
+                'route_progress': progress,
+            })
+        return located
+
+    def _invalidate_profile(self, player_id):
+        self._profile_cache.invalidate(player_id)
+        self._scheduler.expedite(player_id, PROFILE, time.monotonic())
+
+    def _apply_player_update(self, player_id, player_profile, player_state):
+        data = {}
+        latest_activity = player_profile['latest_activity']
+        data['total_experience'] = int(
+            player_profile.get('totalExperiencePoints'))
+        data['level'] = player_profile['playerLevel']
+
+        if player_state is not None:
+            _LOGGER.debug("Zwift player state data: %s", player_state)
+            # relay values are metric whatever the player's display units
+            altitude = player_state.altitude_meters
+            distance = float(player_state.distance)
+            rideons = latest_activity.get('activityRideOnCount', 0)
+            new_ride = not self.players[player_id].online
+            gradient_estimator = self.players[player_id].gradient_estimator
+            if new_ride:
+                gradient_estimator.reset()
+            gradient_estimator.add(distance, altitude)
+            gradient = gradient_estimator.gradient or 0.0
+            state_rideons = player_state.ride_ons
+            if state_rideons != self.players[player_id].data.get('state_rideons', state_rideons):
+                self._invalidate_profile(player_id)
+            data.update({
+                'online': True,
+                'heartrate': int(float(player_state.heartrate)),
+                'cadence': int(float(player_state.cadence)),
+                'power': int(float(player_state.power)),
+                'speed': player_state.speed / 1000000.0,
+                'altitude': altitude,
+                'distance': distance,
+                'gradient': gradient,
+                'rideons': rideons,
+                'state_rideons': state_rideons
+            })
+            data.update(self._locate(
+                player_profile.get('worldId') or 1, player_state, distance))
+            data['group'] = self._groups.get(str(player_id))
+            telemetry = self.players[player_id].telemetry
+            timestamp = player_state.worldTime / 1000.0
+            if new_ride:
+                telemetry.reset()
+                if self.history is not None:
+                    self.history.async_start_activity(player_id, timestamp, {
+                        'world_id': player_profile.get('worldId'),
+                        'world_name': player_profile.get('world_name'),
+                    })
+            values = {field: data[field] for field in TELEMETRY_FIELDS}
+            if telemetry.append(timestamp, **values) and self.history is not None:
+                self.history.async_append(player_id, timestamp, values)
+        elif self.history is not None and self.players[player_id].online:
+            self.history.async_end_activity(player_id)
+        self.players[player_id].data = data
+        for event_type, event_data in self.players[player_id].event_detector.observe(
+                player_profile, data):
+            self._events.async_add(event_type, event_data)
+        return self.players[player_id].set_profile(player_profile)
+
+    def _log_update_error(self, player_id, e):
+        if isinstance(e, RequestException):
+            if '401' in str(e):
+                self._auth.invalidate()
+                _LOGGER.warning(
+                    'Zwift access token was rejected, refreshing it')
+            elif '404' in str(e):
+                _LOGGER.warning('Upstream Zwift 404 - will try later')
+            elif '429' in str(e):
+                _LOGGER.warning('Upstream request throttling 429 - known issue, request rate lowered to {:.2f}/s'.format(
+                    self._api.rate_limiter.rate))
+            else:
+                _LOGGER.exception(
+                    'something went wrong in Zwift python library - {} while updating zwift sensor for player {}'.format(str(e), player_id))
+        else:
+            self.metrics.count_error()
+            _LOGGER.exception(
+                'something went major wrong while updating zwift sensor for player {}'.format(player_id))
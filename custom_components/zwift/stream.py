@@ -0,0 +1,177 @@
+"""
+Push-based player state updates from a Zwift relay.
+
+The relay streams `ServerToClient` protobuf messages. Over TCP each message
+is prefixed with its length as a 2 byte big-endian integer; over UDP every
+datagram carries exactly one message. This speaks the plaintext framing
+used by the legacy relay protocol (and by local stand-in relays such as
+`tools/replay_relay.py`).
+"""
+
+import asyncio
+import logging
+
+from .decoder import (DecodeError, PlayerStateRecord, encode_client_hello,
+                      parse_player_states)
+
+_LOGGER = logging.getLogger(__name__)
+
+PROTOCOL_TCP = 'tcp'
+PROTOCOL_UDP = 'udp'
+
+DEFAULT_PORTS = {
+    PROTOCOL_TCP: 3023,
+    PROTOCOL_UDP: 3022,
+}
+
+READ_SIZE = 4096
+KEEPALIVE_INTERVAL = 5
+RECONNECT_DELAY = 5
+MAX_RECONNECT_DELAY = 300
+
+
+def encode_frame(payload):
+    """Prefix a message with its length, as sent over TCP."""
+    return len(payload).to_bytes(2, 'big') + payload
+
+
+class FrameDecoder:
+    """Split a TCP byte stream into length-prefixed frames."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes, returning every frame completed by them."""
+        self._buffer += data
+        frames = []
+        offset = 0
+        while len(self._buffer) - offset >= 2:
+            size = int.from_bytes(self._buffer[offset:offset + 2], 'big')
+            if len(self._buffer) - offset - 2 < size:
+                break
+            frames.append(bytes(self._buffer[offset + 2:offset + 2 + size]))
+            offset += 2 + size
+        del self._buffer[:offset]
+        return frames
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, stream):
+        self._stream = stream
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        self._stream.handle_message(data)
+
+    def error_received(self, exc):
+        _LOGGER.debug("zwift relay stream error: {}".format(exc))
+
+    def connection_lost(self, exc):
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+
+class RelayStream:
+    """Keep a connection to a relay open and hand over every PlayerState."""
+
+    def __init__(self, host, port, protocol, rider_id, on_player_state):
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.rider_id = rider_id
+        self._on_player_state = on_player_state
+        self._seqno = 0
+        self._record = PlayerStateRecord()
+        self._running = False
+        self.connected = False
+        self.messages = 0
+
+    def _hello(self):
+        """A minimal ClientToServer message announcing who we are."""
+        self._seqno += 1
+        return encode_client_hello(self.rider_id, self._seqno)
+
+    def handle_message(self, payload):
+        """Hand every PlayerState of a message to the callback.
+
+        The same record is reused for every player state, so the callback
+        must copy whatever it wants to keep.
+        """
+        self.messages += 1
+        try:
+            player_states = parse_player_states(payload, self._record)
+        except DecodeError:
+            _LOGGER.debug("dropping undecodable zwift relay message")
+            return
+        while True:
+            try:
+                player_state = next(player_states)
+            except StopIteration:
+                return
+            except DecodeError:
+                _LOGGER.debug("dropping undecodable zwift relay message")
+                return
+            # a failing callback is a bug, not bad data: report it and keep
+            # the stream going
+            try:
+                self._on_player_state(player_state)
+            except Exception:
+                _LOGGER.exception("error handling zwift relay player state {}".format(
+                    player_state.id))
+
+    async def async_run(self):
+        """Stream until `stop` is called, reconnecting with backoff."""
+        self._running = True
+        delay = RECONNECT_DELAY
+        while self._running:
+            try:
+                if self.protocol == PROTOCOL_UDP:
+                    await self._async_run_udp()
+                else:
+                    await self._async_run_tcp()
+                delay = RECONNECT_DELAY
+            except OSError as e:
+                _LOGGER.warning("zwift relay stream to {}:{} failed: {}".format(
+                    self.host, self.port, e))
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            finally:
+                self.connected = False
+            if self._running:
+                await asyncio.sleep(delay)
+
+    def stop(self):
+        self._running = False
+
+    async def _async_run_tcp(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self.connected = True
+        _LOGGER.debug("zwift relay stream connected to {}:{}".format(
+            self.host, self.port))
+        decoder = FrameDecoder()
+        try:
+            writer.write(encode_frame(self._hello()))
+            await writer.drain()
+            while self._running:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                for frame in decoder.feed(data):
+                    self.handle_message(frame)
+        finally:
+            writer.close()
+
+    async def _async_run_udp(self):
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self),
+            remote_addr=(self.host, self.port))
+        self.connected = True
+        try:
+            # the relay only keeps sending while we keep announcing ourselves
+            while self._running and not protocol.closed.done():
+                transport.sendto(self._hello())
+                await asyncio.wait(
+                    [protocol.closed], timeout=KEEPALIVE_INTERVAL)
+        finally:
+            transport.close()
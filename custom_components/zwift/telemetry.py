@@ -0,0 +1,177 @@
+"""
+Per-rider telemetry history.
+
+Samples are kept in fixed-size, array-backed ring buffers (one column per
+field) so memory use is bounded no matter how long a ride lasts. Rolling
+means are maintained incrementally with running sums, which keeps the cost
+of every appended sample O(1) per tracked window.
+
+Polls are not evenly spaced (they back off when throttled, streams are much
+faster), so means are weighted by time: a sample holds its value from the
+previous sample up to its own timestamp, for at most `MAX_SAMPLE_DURATION`
+seconds. A window is only reported once the buffered samples cover all of
+it, so a gap in the data or a ring that wrapped never passes off a shorter
+span as the full window.
+"""
+
+from array import array
+
+FIELDS = ('power', 'heartrate', 'cadence', 'speed', 'altitude', 'distance')
+
+DEFAULT_CAPACITY = 2048
+
+# trailing windows (in seconds) kept up to date for every sample
+ROLLING_WINDOWS = {
+    'power': (3, 10, 30),
+    'heartrate': (30,),
+}
+NORMALIZED_POWER_WINDOW = 30
+BEST_EFFORT_WINDOWS = (5, 60, 300, 1200)
+# a sample never counts for longer than this, e.g. across a dropped poll
+MAX_SAMPLE_DURATION = 10
+# floating point slack when checking that a window is covered
+_COVERAGE_SLACK = 1e-6
+
+
+class _RollingMean:
+    """Time-weighted running mean of one column over a trailing window."""
+
+    __slots__ = ('window', 'start', 'total', 'covered')
+
+    def __init__(self, window):
+        self.window = window
+        self.start = 0
+        self.total = 0.0
+        self.covered = 0.0
+
+
+class TelemetryBuffer:
+    """Ring buffer of timestamped samples for a single rider."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._times = array('d', bytes(8 * capacity))
+        self._durations = array('d', bytes(8 * capacity))
+        self._columns = {field: array('f', bytes(4 * capacity))
+                         for field in FIELDS}
+        windows = set(BEST_EFFORT_WINDOWS)
+        windows.add(NORMALIZED_POWER_WINDOW)
+        windows.update(ROLLING_WINDOWS['power'])
+        self._means = {
+            'power': {window: _RollingMean(window) for window in sorted(windows)},
+            'heartrate': {window: _RollingMean(window)
+                          for window in ROLLING_WINDOWS['heartrate']},
+        }
+        self.reset()
+
+    def reset(self):
+        """Forget all samples and statistics, e.g. when a new ride starts."""
+        self.count = 0
+        self._started = None
+        self._np_total = 0.0
+        self._np_time = 0.0
+        self.best_efforts = {window: None for window in BEST_EFFORT_WINDOWS}
+        for means in self._means.values():
+            for mean in means.values():
+                mean.start = 0
+                mean.total = 0.0
+                mean.covered = 0.0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def last_time(self):
+        if not self.count:
+            return None
+        return self._times[(self.count - 1) % self.capacity]
+
+    def append(self, timestamp, **values):
+        """Add a sample; timestamps (seconds) must be increasing."""
+        last_time = self.last_time
+        if last_time is not None and timestamp <= last_time:
+            return False
+        index = self.count
+        slot = index % self.capacity
+        oldest = index + 1 - self.capacity
+        # expire before writing, the slot we are about to reuse may still
+        # hold the oldest sample of a window
+        for field, means in self._means.items():
+            column = self._columns[field]
+            for mean in means.values():
+                limit = timestamp - mean.window
+                while mean.start < index and (
+                        mean.start < oldest or
+                        self._times[mean.start % self.capacity] <= limit):
+                    duration = self._durations[mean.start % self.capacity]
+                    mean.total -= column[mean.start % self.capacity] * duration
+                    mean.covered -= duration
+                    mean.start += 1
+
+        duration = 0.0
+        if last_time is not None:
+            duration = min(timestamp - last_time, MAX_SAMPLE_DURATION)
+        self._times[slot] = timestamp
+        self._durations[slot] = duration
+        for field in FIELDS:
+            self._columns[field][slot] = values.get(field, 0.0)
+        self.count = index + 1
+        if self._started is None:
+            self._started = timestamp
+
+        for field, means in self._means.items():
+            value = self._columns[field][slot]
+            for mean in means.values():
+                mean.total += value * duration
+                mean.covered += duration
+
+        np_mean = self.rolling_mean('power', NORMALIZED_POWER_WINDOW)
+        if np_mean is not None:
+            self._np_total += np_mean ** 4 * duration
+            self._np_time += duration
+        for window in BEST_EFFORT_WINDOWS:
+            effort = self.rolling_mean('power', window)
+            if effort is None:
+                continue
+            best = self.best_efforts[window]
+            if best is None or effort > best:
+                self.best_efforts[window] = effort
+        return True
+
+    def rolling_mean(self, field, window):
+        """Time-weighted mean of `field` over the trailing `window` seconds.
+
+        None until the buffered samples cover the whole window.
+        """
+        mean = self._means[field][window]
+        if mean.start >= self.count:
+            return None
+        # the oldest sample may have started before the window did
+        slot = mean.start % self.capacity
+        began = self._times[slot] - self._durations[slot]
+        excess = max(self.last_time - window - began, 0.0)
+        covered = mean.covered - excess
+        if covered < window - _COVERAGE_SLACK:
+            return None
+        return (mean.total - self._columns[field][slot] * excess) / covered
+
+    @property
+    def normalized_power(self):
+        if not self._np_time:
+            return None
+        return (self._np_total / self._np_time) ** 0.25
+
+    def latest(self, field):
+        if not self.count:
+            return None
+        return self._columns[field][(self.count - 1) % self.capacity]
+
+    def samples(self, field):
+        """Return the buffered samples of `field`, oldest first, as a list."""
+        start = max(0, self.count - self.capacity)
+        column = self._columns[field]
+        return [column[i % self.capacity] for i in range(start, self.count)]
+
+    def timestamps(self):
+        start = max(0, self.count - self.capacity)
+        return [self._times[i % self.capacity] for i in range(start, self.count)]
@@ -0,0 +1,199 @@
+"""
+Road segment and route lookups per Zwift world.
+
+Zwift does not publish road geometry through its API, so worlds are
+described by JSON files in `<config>/zwift_worlds/<world_id>.json`:
+
+    {
+      "name": "Watopia",
+      "segments": [
+        {"name": "Epic KOM", "road": 5, "start": 120000, "end": 640000}
+      ],
+      "routes": [
+        {"id": 2474227587, "name": "Volcano Circuit", "legs": [
+          {"road": 7, "start": 5000, "end": 1005000, "length": 4100},
+          {"road": 9, "start": 800000, "end": 300000, "length": 2600}
+        ]}
+      ]
+    }
+
+`start` and `end` are relay `roadTime` values (a leg whose end is below its
+start is ridden backwards) and `length` is in meters. A file is compiled
+once into per-road tables: the sorted start/end points of everything on
+the road, and for each interval between two of them the segments and
+route legs covering it. Locating a rider is then one bisect. Compiled
+tables are cached in `.storage` and rebuilt when the file changes.
+"""
+
+import json
+import logging
+import os
+from bisect import bisect_right
+
+from homeassistant.core import callback
+from homeassistant.helpers.storage import STORAGE_DIR
+
+_LOGGER = logging.getLogger(__name__)
+
+WORLDS_DIR = 'zwift_worlds'
+CACHE_DIR = 'zwift_world_index'
+CACHE_VERSION = 1
+
+
+def _interval_table(intervals):
+    """Compile `(road, low, high, item)` tuples into per-road lookup tables."""
+    by_road = {}
+    for road, low, high, item in intervals:
+        by_road.setdefault(road, []).append((min(low, high), max(low, high), item))
+    table = []
+    for road, items in sorted(by_road.items()):
+        breaks = sorted({low for low, _, _ in items} | {high for _, high, _ in items})
+        cover = [[item for low, high, item in items if low <= left < high]
+                 for left in breaks[:-1]]
+        table.append([road, breaks, cover])
+    return table
+
+
+def compile_world(world_id, definition):
+    """Turn a world definition into the tables used by WorldIndex."""
+    segments = []
+    segment_intervals = []
+    for segment in definition.get('segments', []):
+        segment_intervals.append((segment['road'], segment['start'], segment['end'],
+                                  len(segments)))
+        segments.append(segment['name'])
+
+    routes = []
+    legs = []
+    leg_intervals = []
+    for route_index, route in enumerate(definition.get('routes', [])):
+        position = 0.0
+        for leg in route.get('legs', []):
+            leg_intervals.append((leg['road'], leg['start'], leg['end'], len(legs)))
+            legs.append([route_index, leg['start'], leg['end'], position, leg['length']])
+            position += leg['length']
+        routes.append([route.get('id'), route.get('name'), position])
+
+    return {
+        'version': CACHE_VERSION,
+        'world_id': world_id,
+        'name': definition.get('name'),
+        'segments': segments,
+        'routes': routes,
+        'legs': legs,
+        'segment_table': _interval_table(segment_intervals),
+        'leg_table': _interval_table(leg_intervals),
+    }
+
+
+class WorldIndex:
+    """Segment and route lookups for one world."""
+
+    def __init__(self, compiled):
+        self.world_id = compiled['world_id']
+        self.name = compiled.get('name')
+        self._segments = compiled['segments']
+        self._routes = compiled['routes']
+        self._legs = compiled['legs']
+        self._segment_table = {road: (breaks, cover)
+                               for road, breaks, cover in compiled['segment_table']}
+        self._leg_table = {road: (breaks, cover)
+                           for road, breaks, cover in compiled['leg_table']}
+
+    @staticmethod
+    def _covering(table, road_id, road_time):
+        entry = table.get(road_id)
+        if entry is None:
+            return ()
+        breaks, cover = entry
+        index = bisect_right(breaks, road_time) - 1
+        if 0 <= index < len(cover):
+            return cover[index]
+        return ()
+
+    def segment(self, road_id, road_time):
+        """Name of the segment at a road position, or None."""
+        covering = self._covering(self._segment_table, road_id, road_time)
+        return self._segments[covering[0]] if covering else None
+
+    def route(self, road_id, road_time, forward=True, distance=None):
+        """Return `(route_id, route_name, percent complete)` at a road position.
+
+        Roads are shared by many routes and a route may use a road more than
+        once, so every leg covering the position is a candidate. Legs ridden
+        in the rider's direction win, then the one whose distance into the
+        route is closest to the distance ridden so far.
+        """
+        best = None
+        for leg_index in self._covering(self._leg_table, road_id, road_time):
+            route_index, start, end, position, length = self._legs[leg_index]
+            route_length = self._routes[route_index][2]
+            if end == start or not route_length:
+                continue
+            position += length * (road_time - start) / (end - start)
+            score = 0 if (end > start) == forward else 1
+            gap = abs(position - distance % route_length) if distance is not None else 0.0
+            if best is None or (score, gap) < best[0]:
+                best = ((score, gap), route_index, position / route_length)
+        if best is None:
+            return None, None, None
+        route_id, name, _ = self._routes[best[1]]
+        return route_id, name, round(100 * best[2], 1)
+
+
+class WorldIndexes:
+    """Lazily load, compile and cache the index of every world seen."""
+
+    def __init__(self, hass, source_dir=None, cache_dir=None):
+        self.hass = hass
+        self.source_dir = source_dir or hass.config.path(WORLDS_DIR)
+        self.cache_dir = cache_dir or hass.config.path(STORAGE_DIR, CACHE_DIR)
+        self._indexes = {}
+        self._loading = set()
+
+    @callback
+    def get(self, world_id):
+        """The index of a world if it is loaded, starting the load otherwise."""
+        index = self._indexes.get(world_id)
+        if index is None and world_id not in self._indexes and world_id not in self._loading:
+            self._loading.add(world_id)
+            self.hass.async_create_background_task(
+                self._async_load(world_id), 'zwift world index {}'.format(world_id))
+        return index
+
+    async def _async_load(self, world_id):
+        try:
+            self._indexes[world_id] = await self.hass.async_add_executor_job(
+                self.load, world_id)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            _LOGGER.warning("Could not load Zwift world {}: {}".format(world_id, e))
+            self._indexes[world_id] = None
+        finally:
+            self._loading.discard(world_id)
+
+    def load(self, world_id):
+        """Return a WorldIndex, or None when there is no definition file."""
+        source = os.path.join(self.source_dir, '{}.json'.format(world_id))
+        try:
+            stat = os.stat(source)
+        except FileNotFoundError:
+            return None
+        signature = [stat.st_size, stat.st_mtime_ns]
+        cache = os.path.join(self.cache_dir, '{}.json'.format(world_id))
+        try:
+            with open(cache) as cache_file:
+                compiled = json.load(cache_file)
+            if compiled.get('version') == CACHE_VERSION and compiled.get('source') == signature:
+                return WorldIndex(compiled)
+        except (OSError, ValueError):
+            pass
+
+        with open(source) as source_file:
+            compiled = compile_world(world_id, json.load(source_file))
+        compiled['source'] = signature
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(cache + '.tmp', 'w') as cache_file:
+            json.dump(compiled, cache_file)
+        os.replace(cache + '.tmp', cache)
+        _LOGGER.debug("compiled Zwift world {} index".format(world_id))
+        return WorldIndex(compiled)
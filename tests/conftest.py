@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the component is imported as custom_components.zwift, like HA does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
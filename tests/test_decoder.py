@@ -0,0 +1,101 @@
+import random
+
+import pytest
+
+pytest.importorskip('google.protobuf')
+
+from custom_components.zwift.decoder import (PlayerStateRecord,  # noqa: E402
+                                             DecodeError, decode_player_state,
+                                             iter_player_states)
+from custom_components.zwift.zwift_patch import zwift_messages_pb2 as pb2  # noqa: E402
+
+INT32 = (-(1 << 31), (1 << 31) - 1)
+INT64 = (-(1 << 63), (1 << 63) - 1)
+
+
+def random_player_state(rng):
+    """A PlayerState with random values, negatives and defaults included."""
+    values = {}
+    for field in pb2.PlayerState.DESCRIPTOR.fields:
+        if rng.random() < 0.2:
+            continue
+        if field.type == field.TYPE_FLOAT:
+            values[field.name] = rng.uniform(-1e6, 1e6)
+        else:
+            low, high = INT64 if field.type == field.TYPE_INT64 else INT32
+            values[field.name] = rng.choice((
+                rng.randrange(1 << 14), -rng.randrange(1, 1000), rng.randint(low, high)))
+    return pb2.PlayerState(**values)
+
+
+def assert_same(record, message):
+    for name in PlayerStateRecord.__slots__:
+        assert getattr(record, name) == getattr(message, name), name
+
+
+def test_player_states_match_protobuf():
+    rng = random.Random(1)
+    for _ in range(2000):
+        message = random_player_state(rng)
+        assert_same(decode_player_state(message.SerializeToString()), message)
+
+
+def test_server_to_client_matches_protobuf():
+    rng = random.Random(2)
+    for _ in range(200):
+        message = pb2.ServerToClient(
+            tag1=rng.randrange(10), rider_id=rng.randrange(1 << 20),
+            world_time=rng.randrange(1 << 40), seqno=rng.randrange(100),
+            player_states=[random_player_state(rng) for _ in range(rng.randrange(6))],
+            player_updates=[pb2.UnknownMessage() for _ in range(rng.randrange(3))],
+            tag11=rng.randrange(1 << 40), num_msgs=1, msgnum=1)
+        payload = message.SerializeToString()
+        states = [(record.id, record.power, record.altitude)
+                  for record in iter_player_states(payload)]
+        assert states == [(state.id, state.power, state.altitude)
+                          for state in message.player_states]
+
+
+def test_record_is_reused():
+    payload = pb2.ServerToClient(player_states=[
+        pb2.PlayerState(id=1, power=100), pb2.PlayerState(id=2)]).SerializeToString()
+    record = PlayerStateRecord()
+    seen = []
+    for state in iter_player_states(payload, record):
+        assert state is record
+        seen.append((state.id, state.power))
+    # fields missing from a message are reset, not carried over
+    assert seen == [(1, 100), (2, 0)]
+
+
+def test_negative_int32_is_sign_folded():
+    payload = pb2.PlayerState(roadPosition=-5, power=-1).SerializeToString()
+    record = decode_player_state(payload)
+    assert (record.roadPosition, record.power) == (-5, -1)
+
+
+@pytest.mark.parametrize('payload', [
+    b'\x08\x80',              # varint cut short
+    b'\xcd\x01\x00\x00',      # float (field 25) cut short
+    b'\x0a\x05\x01',          # length-delimited field longer than the message
+    b'\x0b',                  # start group, not supported
+])
+def test_malformed_player_state_raises(payload):
+    with pytest.raises(DecodeError):
+        decode_player_state(payload)
+
+
+def test_every_truncation_decodes_or_raises():
+    rng = random.Random(3)
+    payload = pb2.ServerToClient(
+        rider_id=7, player_states=[random_player_state(rng) for _ in range(3)]
+    ).SerializeToString()
+    for end in range(len(payload)):
+        prefix = payload[:end]
+        try:
+            expected = [state.id for state in pb2.ServerToClient.FromString(prefix).player_states]
+        except Exception:
+            with pytest.raises(DecodeError):
+                list(iter_player_states(prefix))
+        else:
+            assert [state.id for state in iter_player_states(prefix)] == expected
@@ -0,0 +1,71 @@
+import pytest
+
+from custom_components.zwift.groups import RiderPosition, analyze
+
+# 36 km/h in the relay's millimeters per hour, i.e. 10 m/s
+SPEED = 36000000
+
+
+def rider(player_id, road_time, meters, forward=True, road_id=1, speed=SPEED):
+    # positions are in centimeters
+    return RiderPosition(player_id, road_id, road_time, forward, meters * 100.0, 0.0, speed)
+
+
+def test_group_neighbours_and_gaps():
+    riders = [
+        rider('4', 400, 300),
+        rider('1', 100, 0),
+        rider('3', 108, 8),
+        rider('2', 105, 5),
+        # other direction and other road, never mixed in
+        rider('5', 106, 6, forward=False),
+        rider('6', 106, 6, road_id=2),
+    ]
+    results = analyze(riders, {'2', '4'})
+    assert set(results) == {'2', '4'}
+
+    second = results['2']
+    assert second['riders_nearby'] == 2
+    assert second['group_size'] == 3
+    assert second['group_position'] == 2
+    assert second['ahead'] == {'player_id': '3', 'distance': 3.0, 'time': 0.3}
+    assert second['behind'] == {'player_id': '1', 'distance': 5.0, 'time': 0.5}
+    assert second['tracked'] == {'4': {'distance': 295.0, 'time': 29.5}}
+
+    leader = results['4']
+    assert leader['riders_nearby'] == 0
+    assert (leader['group_size'], leader['group_position']) == (1, 1)
+    assert leader['ahead'] is None
+    assert leader['behind'] == {'player_id': '3', 'distance': 292.0, 'time': 29.2}
+    assert leader['tracked'] == {'2': {'distance': -295.0, 'time': 29.5}}
+
+
+def test_riding_backwards_road_time_decreases():
+    results = analyze([rider('1', 500, 0, forward=False),
+                       rider('2', 400, 20, forward=False)], {'1'})
+    assert results['1']['ahead']['player_id'] == '2'
+    assert results['1']['behind'] is None
+    assert results['1']['group_position'] == 2
+
+
+def test_stopped_riders_group_by_distance():
+    riders = [rider('1', 100, 0, speed=0), rider('2', 101, 9, speed=0),
+              rider('3', 102, 30, speed=0)]
+    results = analyze(riders, {'1'})
+    assert results['1']['group_size'] == 2
+    assert results['1']['ahead'] == {'player_id': '2', 'distance': 9.0, 'time': None}
+
+
+def test_nearby_counts_riders_within_distance():
+    riders = [rider(str(index), index, index * 50) for index in range(10)]
+    # 200 m either way of rider 4 at 200 m: riders 0 to 8
+    assert analyze(riders, {'4'})['4']['riders_nearby'] == 8
+
+
+def test_untracked_lanes_are_skipped():
+    assert analyze([rider('1', 100, 0)], {'2'}) == {}
+
+
+@pytest.mark.parametrize('speed, expected', [(SPEED, 10.0), (0, 0.0)])
+def test_meters_per_second(speed, expected):
+    assert rider('1', 0, 0, speed=speed).meters_per_second == expected
@@ -0,0 +1,65 @@
+import os
+from array import array
+
+import pytest
+
+pytest.importorskip('homeassistant')
+
+from custom_components.zwift.history import (COLUMN_SUFFIX,  # noqa: E402
+                                             TIME_COLUMN, RideHistory,
+                                             power_curve)
+
+
+def test_power_curve_of_steady_effort():
+    times = [float(t) for t in range(120)]
+    curve = power_curve(times, [200.0] * 120, (1, 60, 300))
+    assert curve == {1: 200.0, 60: 200.0, 300: None}
+
+
+def test_power_curve_finds_best_interval():
+    times = [float(t) for t in range(100)]
+    power = [100.0] * 100
+    power[40:50] = [400.0] * 10
+    curve = power_curve(times, power, (5, 10, 20))
+    assert curve[5] == 400.0
+    assert curve[10] == 400.0
+    assert curve[20] == 250.0
+
+
+def test_power_curve_weights_samples_by_duration():
+    # a 10 s poll at 300 W outweighs the 1 s samples around it
+    times = [0.0, 1.0, 2.0, 12.0, 13.0]
+    power = [100.0, 100.0, 300.0, 100.0, 100.0]
+    assert power_curve(times, power, (10,))[10] == 300.0
+
+
+def test_power_curve_caps_gaps():
+    # the 600 s gap counts as MAX_SAMPLE_DURATION seconds only
+    curve = power_curve([0.0, 600.0], [200.0, 200.0], (5, 60))
+    assert curve == {5: 200.0, 60: None}
+
+
+def test_power_curve_without_samples():
+    assert power_curve([], [], (5,)) == {5: None}
+
+
+def write_activity(root, player_id, activity_id, times, power):
+    path = os.path.join(root, player_id, activity_id)
+    os.makedirs(path)
+    with open(os.path.join(path, TIME_COLUMN + COLUMN_SUFFIX), 'wb') as column_file:
+        array('d', times).tofile(column_file)
+    with open(os.path.join(path, 'power' + COLUMN_SUFFIX), 'wb') as column_file:
+        array('f', power).tofile(column_file)
+
+
+def test_stored_activity_power_curve(tmp_path):
+    history = RideHistory(None, root=str(tmp_path))
+    write_activity(str(tmp_path), '1', '100', [float(t) for t in range(30)], [250.0] * 30)
+    assert history.power_curve('1', '100', (5, 60)) == {5: 250.0, 60: None}
+
+
+def test_unknown_or_empty_activity(tmp_path):
+    history = RideHistory(None, root=str(tmp_path))
+    assert history.power_curve('1', '100') is None
+    os.makedirs(os.path.join(str(tmp_path), '1', '200'))
+    assert history.power_curve('1', '200', (5,)) == {5: None}
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from custom_components.zwift.ratelimit import RateLimiter, parse_retry_after
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('120', 120.0),
+    ('1.5', 1.5),
+    ('-3', 0.0),
+    ('', None),
+    (None, None),
+    ('soon', None),
+])
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    now = 1700000000.0
+    value = format_datetime(datetime.fromtimestamp(now + 30, timezone.utc), usegmt=True)
+    assert parse_retry_after(value, now) == pytest.approx(30.0)
+    assert parse_retry_after(value, now + 60) == 0.0
+
+
+def test_rate_adapts_additively_up_and_multiplicatively_down():
+    limiter = RateLimiter(max_rate=4.0, min_rate=0.5, increase=0.25, decrease=0.5)
+    limiter.on_throttled()
+    assert limiter.rate == 2.0
+    limiter.on_throttled()
+    limiter.on_throttled()
+    limiter.on_throttled()
+    assert limiter.rate == 0.5
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.rate == 4.0
+
+
+def test_burst_then_refill_rate():
+    async def run():
+        limiter = RateLimiter(max_rate=50.0, burst=3)
+        started = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire()
+        burst = time.monotonic() - started
+        for _ in range(5):
+            await limiter.acquire()
+        return burst, time.monotonic() - started
+
+    burst, total = asyncio.run(run())
+    assert burst < 0.02
+    # five more tokens at 50/s
+    assert total == pytest.approx(0.1, abs=0.05)
+
+
+def test_retry_after_blocks_requests():
+    async def run():
+        limiter = RateLimiter(max_rate=1000.0, burst=5)
+        limiter.on_throttled(retry_after=0.1)
+        started = time.monotonic()
+        await limiter.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.1
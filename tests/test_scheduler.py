@@ -0,0 +1,87 @@
+from custom_components.zwift.scheduler import PROFILE, STATE, PlayerScheduler
+
+
+def make_scheduler():
+    return PlayerScheduler(online_interval=2, offline_interval=60, profile_interval=30)
+
+
+def test_new_player_profile_is_due_immediately():
+    scheduler = make_scheduler()
+    scheduler.add('1', 100)
+    assert scheduler.next_due() == 100
+    assert scheduler.pop_due(100) == ({'1'}, set())
+    assert scheduler.next_due() is None
+
+
+def test_riding_player_polls_state_and_profile():
+    scheduler = make_scheduler()
+    scheduler.add('1', 0)
+    scheduler.pop_due(0)
+    scheduler.reschedule('1', 0, riding=True, profile=True)
+    assert scheduler.pop_due(2) == (set(), {'1'})
+    scheduler.reschedule('1', 2, riding=True, state=True)
+    assert scheduler.next_due() == 4
+    assert scheduler.pop_due(30) == ({'1'}, {'1'})
+
+
+def test_offline_player_backs_off_up_to_offline_interval():
+    scheduler = make_scheduler()
+    scheduler.add('1', 0)
+    now = 0
+    delays = []
+    for _ in range(7):
+        profile_ids, _ = scheduler.pop_due(now)
+        assert profile_ids == {'1'}
+        scheduler.reschedule('1', now, riding=False, profile=True)
+        delays.append(scheduler.next_due() - now)
+        now = scheduler.next_due()
+    assert delays == [2, 4, 8, 16, 32, 60, 60]
+
+
+def test_riding_again_resets_backoff_and_going_offline_drops_state():
+    scheduler = make_scheduler()
+    scheduler.add('1', 0)
+    for now in (0, 2, 6):
+        scheduler.pop_due(now)
+        scheduler.reschedule('1', now, riding=False, profile=True)
+    scheduler.pop_due(14)
+    scheduler.reschedule('1', 14, riding=True, profile=True)
+    assert scheduler.pop_due(16) == (set(), {'1'})
+    scheduler.reschedule('1', 16, riding=False, state=True)
+    # no state poll left, only the profile poll from when it was riding
+    assert scheduler.pop_due(1000) == ({'1'}, set())
+
+
+def test_expedite_only_moves_polls_earlier():
+    scheduler = make_scheduler()
+    scheduler.add('1', 0)
+    scheduler.pop_due(0)
+    scheduler.reschedule('1', 0, riding=True, profile=True)
+    scheduler.expedite('1', PROFILE, 50)
+    assert scheduler.pop_due(29) == (set(), {'1'})
+    scheduler.expedite('1', PROFILE, 10)
+    assert scheduler.pop_due(10) == ({'1'}, set())
+    # unknown players are ignored
+    scheduler.expedite('2', STATE, 0)
+    assert scheduler.pop_due(10) == (set(), set())
+
+
+def test_slack_batches_polls_due_close_together():
+    scheduler = make_scheduler()
+    scheduler.add('1', 0)
+    scheduler.add('2', 0.5)
+    assert scheduler.pop_due(0) == ({'1'}, set())
+    scheduler.add('3', 1.0)
+    scheduler.add('4', 1.5)
+    assert scheduler.pop_due(0.5, slack=0.6) == ({'2', '3'}, set())
+
+
+def test_removed_player_is_not_due():
+    scheduler = make_scheduler()
+    scheduler.add('1', 0)
+    scheduler.add('2', 1)
+    scheduler.remove('1')
+    assert scheduler.next_due() == 1
+    assert scheduler.pop_due(10) == ({'2'}, set())
+    scheduler.reschedule('1', 10, riding=True, profile=True)
+    assert scheduler.next_due() is None
@@ -0,0 +1,79 @@
+import pytest
+
+from custom_components.zwift.telemetry import TelemetryBuffer
+
+
+def feed(buffer, samples):
+    for timestamp, power in samples:
+        buffer.append(timestamp, power=power)
+
+
+def test_means_are_weighted_by_duration():
+    buffer = TelemetryBuffer()
+    # 2 s polls alternating 300 and 100 W, ending on 100 W
+    feed(buffer, [(2 * i, 300 if i % 2 == 0 else 100) for i in range(40)])
+    # 2 s at 100 W and the last second of a 300 W sample
+    assert buffer.rolling_mean('power', 3) == pytest.approx(500 / 3)
+    assert buffer.rolling_mean('power', 10) == pytest.approx(180)
+    assert buffer.best_efforts[5] == pytest.approx(220)
+    assert buffer.best_efforts[60] == pytest.approx(200)
+
+
+def test_uneven_spacing_does_not_bias_the_mean():
+    buffer = TelemetryBuffer()
+    # ten 1 s samples at 100 W, then one 10 s poll at 400 W
+    feed(buffer, [(i, 100) for i in range(11)] + [(20, 400)])
+    assert buffer.rolling_mean('power', 10) == pytest.approx(400)
+    # 20 s of data so far
+    assert buffer.rolling_mean('power', 30) is None
+    feed(buffer, [(21, 400), (30, 100), (31, 100)])
+    # 9 s at 100 W, 11 s at 400 W and 10 s at 100 W; per sample it would be 146 W
+    assert buffer.rolling_mean('power', 30) == pytest.approx(210)
+
+
+def test_windows_are_only_reported_when_covered():
+    buffer = TelemetryBuffer()
+    feed(buffer, [(0, 200)])
+    assert buffer.rolling_mean('power', 3) is None
+    assert buffer.normalized_power is None
+    feed(buffer, [(1, 200), (2, 200)])
+    assert buffer.rolling_mean('power', 3) is None
+    feed(buffer, [(3, 200)])
+    assert buffer.rolling_mean('power', 3) == pytest.approx(200)
+    assert buffer.best_efforts[5] is None
+
+
+def test_gaps_are_not_covered():
+    buffer = TelemetryBuffer()
+    feed(buffer, [(i, 100) for i in range(10)] + [(60, 100)])
+    # the last sample only counts for MAX_SAMPLE_DURATION seconds
+    assert buffer.rolling_mean('power', 10) == pytest.approx(100)
+    assert buffer.rolling_mean('power', 30) is None
+
+
+def test_wrapped_ring_never_reports_longer_windows():
+    buffer = TelemetryBuffer(capacity=100)
+    feed(buffer, [(i / 10.0, 250) for i in range(5000)])
+    # 100 samples at 10 Hz cover 10 s and nothing more
+    assert buffer.rolling_mean('power', 10) == pytest.approx(250)
+    assert buffer.rolling_mean('power', 30) is None
+    assert buffer.best_efforts[5] == pytest.approx(250)
+    assert buffer.best_efforts[60] is None
+    assert len(buffer) == 100
+
+
+def test_normalized_power_of_steady_effort():
+    buffer = TelemetryBuffer()
+    feed(buffer, [(i, 250) for i in range(120)])
+    assert buffer.normalized_power == pytest.approx(250)
+
+
+def test_reset_and_out_of_order_samples():
+    buffer = TelemetryBuffer()
+    feed(buffer, [(i, 300) for i in range(10)])
+    assert not buffer.append(5, power=0)
+    assert buffer.latest('power') == 300
+    buffer.reset()
+    assert len(buffer) == 0
+    assert buffer.rolling_mean('power', 3) is None
+    assert buffer.best_efforts[5] is None
@@ -0,0 +1,124 @@
+"""
+Local stand-in for a Zwift relay that replays captured ServerToClient frames.
+
+The capture file uses the same framing as the relay's TCP stream: every
+message is prefixed with its length as a 2 byte big-endian integer. Point
+the sensor's `stream:` option at this server to exercise streaming mode
+without touching Zwift:
+
+    python tools/replay_relay.py capture.bin --port 3023 --rate 2 --loop
+
+    sensor:
+      - platform: zwift
+        ...
+        stream:
+          host: 127.0.0.1
+          port: 3023
+"""
+
+import argparse
+import asyncio
+import logging
+
+_LOGGER = logging.getLogger('replay_relay')
+
+
+def read_frames(path):
+    """Return the list of messages stored in a capture file."""
+    with open(path, 'rb') as capture:
+        data = capture.read()
+    frames = []
+    offset = 0
+    while offset + 2 <= len(data):
+        size = int.from_bytes(data[offset:offset + 2], 'big')
+        frames.append(data[offset + 2:offset + 2 + size])
+        offset += 2 + size
+    return frames
+
+
+async def replay(frames, send, rate, loop):
+    while True:
+        for frame in frames:
+            if not send(frame):
+                return
+            await asyncio.sleep(1.0 / rate)
+        if not loop:
+            return
+
+
+async def serve_tcp(frames, host, port, rate, loop):
+    async def handle(reader, writer):
+        peer = writer.get_extra_info('peername')
+        _LOGGER.info("client connected: %s", peer)
+
+        def send(frame):
+            if writer.is_closing():
+                return False
+            writer.write(len(frame).to_bytes(2, 'big') + frame)
+            return True
+
+        try:
+            await replay(frames, send, rate, loop)
+        finally:
+            writer.close()
+            _LOGGER.info("client done: %s", peer)
+
+    server = await asyncio.start_server(handle, host, port)
+    _LOGGER.info("replaying %d frames over tcp on %s:%d", len(frames), host, port)
+    async with server:
+        await server.serve_forever()
+
+
+class _UdpRelay(asyncio.DatagramProtocol):
+    def __init__(self, frames, rate, loop):
+        self.frames = frames
+        self.rate = rate
+        self.loop = loop
+        self.clients = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        # any datagram (normally a ClientToServer hello) subscribes the sender
+        if addr not in self.clients:
+            _LOGGER.info("client subscribed: %s", addr)
+
+            def send(frame):
+                self.transport.sendto(frame, addr)
+                return True
+
+            self.clients[addr] = asyncio.ensure_future(
+                replay(self.frames, send, self.rate, self.loop))
+
+
+async def serve_udp(frames, host, port, rate, loop):
+    transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: _UdpRelay(frames, rate, loop), local_addr=(host, port))
+    _LOGGER.info("replaying %d frames over udp on %s:%d", len(frames), host, port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        transport.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('capture', help='file of length-prefixed ServerToClient frames')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--protocol', choices=['tcp', 'udp'], default='tcp')
+    parser.add_argument('--rate', type=float, default=1.0, help='frames per second')
+    parser.add_argument('--loop', action='store_true', help='replay forever')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    frames = read_frames(args.capture)
+    if args.protocol == 'udp':
+        asyncio.run(serve_udp(frames, args.host, args.port or 3022, args.rate, args.loop))
+    else:
+        asyncio.run(serve_tcp(frames, args.host, args.port or 3023, args.rate, args.loop))
+
+
+if __name__ == '__main__':
+    main()